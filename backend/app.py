@@ -1,16 +1,26 @@
 """
 NeroStack Backend - Application Flask principale
 Gestion de l'authentification, des accès temporaires et intégration IA
+
+En production, lancer `gunicorn -c gunicorn.conf.py app:app` (preload_app) :
+l'application est construite une seule fois dans le processus maître,
+puis les workers sont forkés à partir de ce processus déjà initialisé.
 """
 import os
 import logging
-from flask import Flask, jsonify
+import importlib
+import orjson
+from flask import Flask, Response, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 
 from config import config
 from models import db
+from utils.cache import init_cache
+from utils.http import init_http_sessions
+from tasks import celery_init_app
+from utils.json_provider import OrjsonProvider
 
 # Configuration du logging
 logging.basicConfig(
@@ -19,13 +29,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Corps des réponses 401 JWT, sérialisés une seule fois (partagés par les
+# workers après le fork grâce au copy-on-write)
+_EXPIRED_BODY = orjson.dumps({
+    'error': 'Token expiré',
+    'message': 'Veuillez vous reconnecter'
+})
+_MISSING_BODY = orjson.dumps({
+    'error': 'Token manquant',
+    'message': 'Authentification requise'
+})
+
+# Blueprints (module, attribut) importés uniquement s'ils sont enregistrés
+BLUEPRINTS = [
+    ('routes.auth', 'auth_bp'),
+    ('routes.users', 'users_bp'),
+    ('routes.documents', 'documents_bp'),
+    ('routes.access', 'access_bp'),
+    ('routes.ai', 'ai_bp'),
+    ('routes.health', 'health_bp'),
+]
+
 
-def create_app(config_name: str = None) -> Flask:
+def _warmup_queries() -> None:
+    """
+    Exécute une fois les requêtes du chemin chaud avec des identifiants
+    inexistants. Le cache de compilation SQLAlchemy est rempli dans le
+    processus maître et hérité par les workers après le fork.
+    """
+    from models.user import User
+    from models.temporary_access import TemporaryAccess
+    from models.document_analysis import DocumentAnalysis
+    
+    db.session.get(User, 0)
+    User.find_by_login('')
+    TemporaryAccess.check_document_access.__wrapped__(0, 0)
+    TemporaryAccess.get_allowed_doc_ids(0)
+    TemporaryAccess.list_for_user_dicts(0, valid_only=True)
+    DocumentAnalysis.get_cached_analysis(0)
+    db.session.remove()
+
+
+def create_app(config_name: str = None, load_blueprints: bool = True) -> Flask:
     """
     Factory pour créer l'application Flask.
     
     Args:
         config_name: Nom de la configuration (development, production, testing)
+        load_blueprints: Importer et enregistrer les routes. Les scripts qui
+            n'ont besoin que de la base (init_db.py) passent False.
     
     Returns:
         Application Flask configurée
@@ -35,6 +87,7 @@ def create_app(config_name: str = None) -> Flask:
     
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.json = OrjsonProvider(app)
     
     # Initialiser les extensions
     db.init_app(app)
@@ -45,45 +98,39 @@ def create_app(config_name: str = None) -> Flask:
     # Migrations
     Migrate(app, db)
     
+    # Cache Redis
+    init_cache(app)
+    
+    # Sessions HTTP Mayan / Ollama (keep-alive)
+    init_http_sessions(app)
+    
+    # File de tâches (analyses IA en arrière-plan)
+    celery_init_app(app)
+    
     # CORS
     CORS(app, origins=app.config.get('CORS_ORIGINS', ['*']))
     
     # Callbacks JWT
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
-        return jsonify({
-            'error': 'Token expiré',
-            'message': 'Veuillez vous reconnecter'
-        }), 401
+        return Response(_EXPIRED_BODY, status=401, mimetype='application/json')
     
     @jwt.invalid_token_loader
     def invalid_token_callback(error):
-        return jsonify({
+        return Response(orjson.dumps({
             'error': 'Token invalide',
             'message': str(error)
-        }), 401
+        }), status=401, mimetype='application/json')
     
     @jwt.unauthorized_loader
     def missing_token_callback(error):
-        return jsonify({
-            'error': 'Token manquant',
-            'message': 'Authentification requise'
-        }), 401
+        return Response(_MISSING_BODY, status=401, mimetype='application/json')
     
     # Enregistrer les blueprints
-    from routes.auth import auth_bp
-    from routes.users import users_bp
-    from routes.documents import documents_bp
-    from routes.access import access_bp
-    from routes.ai import ai_bp
-    from routes.health import health_bp
-    
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(users_bp)
-    app.register_blueprint(documents_bp)
-    app.register_blueprint(access_bp)
-    app.register_blueprint(ai_bp)
-    app.register_blueprint(health_bp)
+    if load_blueprints:
+        for module_path, attr in BLUEPRINTS:
+            module = importlib.import_module(module_path)
+            app.register_blueprint(getattr(module, attr))
     
     # Route racine
     @app.route('/')
@@ -110,6 +157,13 @@ def create_app(config_name: str = None) -> Flask:
             'message': 'La ressource demandée n\'existe pas'
         }), 404
     
+    @app.errorhandler(413)
+    def payload_too_large(error):
+        return jsonify({
+            'error': 'Fichier trop volumineux',
+            'message': f"Taille maximale: {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} Mo"
+        }), 413
+    
     @app.errorhandler(500)
     def internal_error(error):
         logger.error(f"Erreur interne: {error}")
@@ -118,38 +172,62 @@ def create_app(config_name: str = None) -> Flask:
             'message': 'Une erreur inattendue s\'est produite'
         }), 500
     
-    # Créer les tables si elles n'existent pas
+    # Créer les tables et l'admin par défaut au démarrage (développement).
+    # En production (AUTO_BOOTSTRAP_DB=False), init_db.py est l'unique
+    # source de vérité : chaque worker gunicorn évite ainsi la réflexion du
+    # schéma et la requête sur l'admin.
     with app.app_context():
-        db.create_all()
+        if app.config.get('AUTO_BOOTSTRAP_DB', False):
+            db.create_all()
+            
+            # Créer un admin par défaut si aucun n'existe
+            # (SKIP_ADMIN_BOOTSTRAP=1 évite la requête et l'import du modèle)
+            if os.getenv('SKIP_ADMIN_BOOTSTRAP') != '1':
+                from models.user import User
+                if not User.query.filter_by(role='admin').first():
+                    try:
+                        admin = User.create_user(
+                            username='admin',
+                            email='admin@nerostack.local',
+                            password='admin123',
+                            first_name='Admin',
+                            last_name='NeroStack',
+                            role='admin'
+                        )
+                        logger.info(f"Admin par défaut créé: {admin.username}")
+                    except Exception as e:
+                        logger.warning(f"Impossible de créer l'admin par défaut: {e}")
         
-        # Créer un admin par défaut si aucun n'existe
-        from models.user import User
-        if not User.query.filter_by(role='admin').first():
+        if load_blueprints and app.config.get('SQL_WARMUP', False):
             try:
-                admin = User.create_user(
-                    username='admin',
-                    email='admin@nerostack.local',
-                    password='admin123',
-                    first_name='Admin',
-                    last_name='NeroStack',
-                    role='admin'
-                )
-                logger.info(f"Admin par défaut créé: {admin.username}")
+                _warmup_queries()
             except Exception as e:
-                logger.warning(f"Impossible de créer l'admin par défaut: {e}")
+                db.session.remove()
+                logger.warning(f"Préchauffage des requêtes impossible: {e}")
+        
+        logger.info(f"Pool de connexions: {db.engine.pool.status()}")
     
     logger.info(f"Application démarrée en mode {config_name}")
     
     return app
 
 
-# Point d'entrée pour gunicorn
-app = create_app()
+def __getattr__(name: str):
+    """
+    Point d'entrée pour gunicorn (app:app) et flask run.
+    L'application n'est construite qu'à la première lecture de `app`, pour que
+    `from app import create_app` (init_db.py) ne charge pas toutes les routes.
+    """
+    if name == 'app':
+        application = create_app()
+        globals()['app'] = application
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == '__main__':
     # Développement local
-    app.run(
+    create_app().run(
         host='0.0.0.0',
         port=8080,
         debug=True
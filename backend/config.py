@@ -4,6 +4,7 @@ Configuration de l'application Flask
 import os
 from datetime import timedelta
 from dotenv import load_dotenv
+from sqlalchemy.pool import NullPool
 
 load_dotenv()
 
@@ -22,6 +23,9 @@ class Config:
     JWT_COOKIE_SECURE = os.getenv('JWT_COOKIE_SECURE', 'False').lower() == 'true'
     JWT_COOKIE_CSRF_PROTECT = True
     
+    # Coût bcrypt (2^rounds itérations)
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+    
     # Configuration Base de données PostgreSQL
     SQLALCHEMY_DATABASE_URI = os.getenv(
         'DATABASE_URL', 
@@ -29,14 +33,44 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # db.create_all() + admin par défaut au démarrage de l'application.
+    # Désactivé en production : utiliser init_db.py
+    AUTO_BOOTSTRAP_DB = os.getenv('AUTO_BOOTSTRAP_DB', 'True').lower() == 'true'
+    
+    # Pool de connexions : réutiliser des connexions chaudes plutôt que
+    # d'ouvrir/fermer une connexion PostgreSQL à chaque requête
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 20)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+        # Cache de compilation des requêtes (500 par défaut)
+        'query_cache_size': 1200,
+        'echo': False
+    }
+    
+    # Exécuter les requêtes chaudes au démarrage pour remplir le cache de
+    # compilation avant la première requête HTTP
+    SQL_WARMUP = os.getenv('SQL_WARMUP', 'True').lower() == 'true'
+    
+    # raiseload('*') sur les requêtes de listing (activé hors production)
+    SQLALCHEMY_RAISELOAD = False
+    
     # Configuration Mayan EDMS
     MAYAN_URL = os.getenv('MAYAN_URL', 'http://mayan:8000')
     MAYAN_ADMIN_USER = os.getenv('MAYAN_ADMIN_USER', 'admin')
     MAYAN_ADMIN_PASSWORD = os.getenv('MAYAN_ADMIN_PASSWORD', 'admin')
     
+    # Taille maximale d'un upload (Mo) : au-delà, 413 sans lire le corps
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_UPLOAD_MB', 100)) * 1024 * 1024
+    
     # Configuration Ollama (IA Locale)
     OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://service_ia_locale:11434')
-    OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2')
+    OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2:3b-instruct-q4_K_M')
+    
+    # Taille du pool de connexions HTTP par service externe (Mayan, Ollama)
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 20))
     
     # Configuration CORS
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://votre_client:3000').split(',')
@@ -45,18 +79,70 @@ class Config:
     RATELIMIT_STORAGE_URL = os.getenv('REDIS_URL', 'memory://')
     RATELIMIT_DEFAULT = "200 per day"
     RATELIMIT_HEADERS_ENABLED = True
+    
+    # Cache des décisions d'accès temporaires (secondes)
+    ACCESS_CACHE_TTL = int(os.getenv('ACCESS_CACHE_TTL', 45))
+    
+    # Cache Redis des analyses IA terminées (secondes)
+    ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', 86400))
+    # Durée maximale pendant laquelle une analyse en cours absorbe les
+    # demandes identiques (au-delà, elle est considérée comme perdue)
+    ANALYSIS_INFLIGHT_TTL = int(os.getenv('ANALYSIS_INFLIGHT_TTL', 600))
+    
+    # Cache Redis du texte OCR des documents Mayan, par version (secondes)
+    MAYAN_CONTENT_CACHE_TTL = int(os.getenv('MAYAN_CONTENT_CACHE_TTL', 3600))
+    # Cache Redis des métadonnées d'un document et des types de documents
+    # Mayan, par token (secondes)
+    MAYAN_DOCUMENT_CACHE_TTL = int(os.getenv('MAYAN_DOCUMENT_CACHE_TTL', 30))
+    MAYAN_TYPES_CACHE_TTL = int(os.getenv('MAYAN_TYPES_CACHE_TTL', 300))
+    # Cache des pages de la liste des documents (préchargée à la connexion)
+    MAYAN_LIST_CACHE_TTL = int(os.getenv('MAYAN_LIST_CACHE_TTL', 15))
+    # Après un upload accepté en différé (202), la liste des documents est
+    # relue sans cache pendant ce délai, le temps que Mayan crée le
+    # document (secondes)
+    MAYAN_UPLOAD_PENDING_TTL = int(os.getenv('MAYAN_UPLOAD_PENDING_TTL', 30))
+    # Conservation des corps Mayan accompagnés d'un ETag, pour les GET
+    # conditionnels (If-None-Match -> 304) (secondes)
+    MAYAN_ETAG_CACHE_TTL = int(os.getenv('MAYAN_ETAG_CACHE_TTL', 3600))
+    
+    # Durée de validité des ETags de GET /api/documents/<id> et .../tags :
+    # pendant ce délai, un If-None-Match identique reçoit 304 sans appel
+    # à Mayan (secondes)
+    DOCUMENT_ETAG_TTL = int(os.getenv('DOCUMENT_ETAG_TTL', 60))
+    
+    # Cache Redis des générations IA (résumés/mots-clés, réponses), par
+    # empreinte du contenu (secondes)
+    LLM_SUMMARY_CACHE_TTL = int(os.getenv('LLM_SUMMARY_CACHE_TTL', 86400))
+    LLM_ANSWER_CACHE_TTL = int(os.getenv('LLM_ANSWER_CACHE_TTL', 14400))
+    
+    # File de tâches Celery (analyses IA). Sans Redis, les tâches sont
+    # exécutées immédiatement dans le processus web (mode eager)
+    CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', RATELIMIT_STORAGE_URL)
+    CELERY = {
+        'broker_url': CELERY_BROKER_URL,
+        'task_ignore_result': True,
+        'task_always_eager': not CELERY_BROKER_URL.startswith(('redis://', 'rediss://')),
+        'worker_prefetch_multiplier': 1,
+        'task_acks_late': True,
+        # File dédiée aux analyses : les synchronisations Mayan (file par
+        # défaut) ne patientent pas derrière une série d'inférences
+        'task_routes': {'tasks.analysis.*': {'queue': 'analysis'}}
+    }
 
 
 class DevelopmentConfig(Config):
     """Configuration de développement"""
     DEBUG = True
     JWT_COOKIE_SECURE = False
+    # Lever une erreur sur tout chargement paresseux de relation (N+1)
+    SQLALCHEMY_RAISELOAD = True
 
 
 class ProductionConfig(Config):
     """Configuration de production"""
     DEBUG = False
     JWT_COOKIE_SECURE = True
+    AUTO_BOOTSTRAP_DB = os.getenv('AUTO_BOOTSTRAP_DB', 'False').lower() == 'true'
 
 
 class TestingConfig(Config):
@@ -66,6 +152,14 @@ class TestingConfig(Config):
         'TEST_DATABASE_URL',
         'postgresql://nerostack:nerostack_password@db:5432/nerostack_test_db'
     )
+    # Hash quasi instantané en test
+    BCRYPT_ROUNDS = 4
+    # Pas de pool en test : chaque test repart d'une connexion neuve
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': NullPool
+    }
+    SQL_WARMUP = False
+    SQLALCHEMY_RAISELOAD = True
 
 
 config = {
@@ -0,0 +1,35 @@
+"""
+Configuration Gunicorn
+Lancement: gunicorn -c gunicorn.conf.py app:app
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8080')
+
+# Processus (parallélisme CPU) x threads (attentes I/O Mayan / Ollama)
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+# Application construite une fois dans le maître puis forkée (copy-on-write)
+preload_app = True
+
+# Recycler les workers régulièrement pour borner la mémoire
+max_requests = 1000
+max_requests_jitter = 100
+
+# Les analyses IA peuvent être longues
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+
+def post_fork(server, worker):
+    """
+    Les connexions PostgreSQL ouvertes par le maître pendant create_app()
+    ne doivent pas être partagées entre workers : chaque worker repart
+    d'un pool vide.
+    """
+    from app import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -18,6 +18,9 @@ psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-E
     -- Se connecter à la nouvelle base et configurer les permissions
     \c nerostack_db
     GRANT ALL ON SCHEMA public TO nerostack;
+    
+    -- Index trigrammes pour la recherche d'utilisateurs (ILIKE '%...%')
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
 EOSQL
 
 echo "✅ Base de données nerostack_db créée avec succès!"
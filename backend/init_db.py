@@ -6,6 +6,8 @@ Crée les tables et l'utilisateur admin par défaut
 import os
 import sys
 
+from sqlalchemy.dialects import postgresql
+
 # Ajouter le répertoire courant au path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
@@ -13,54 +15,68 @@ from app import create_app
 from models import db
 from models.user import User
 
+# Comptes créés par défaut (mots de passe en clair pour l'affichage)
+DEFAULT_USERS = [
+    {
+        'username': 'admin',
+        'email': 'admin@nerostack.local',
+        'password': 'admin123',
+        'first_name': 'Admin',
+        'last_name': 'NeroStack',
+        'role': 'admin'
+    },
+    {
+        'username': 'testuser',
+        'email': 'test@nerostack.local',
+        'password': 'test123',
+        'first_name': 'Test',
+        'last_name': 'User',
+        'role': 'user'
+    },
+]
+
 
 def init_database():
     """Initialise la base de données avec les données de base"""
-    app = create_app()
+    # Les routes ne sont pas nécessaires pour créer le schéma
+    app = create_app(load_blueprints=False)
     
     with app.app_context():
         # Créer toutes les tables
         db.create_all()
         print("✅ Tables créées avec succès")
         
-        # Créer l'utilisateur admin par défaut
-        admin = User.query.filter_by(username='admin').first()
-        if not admin:
-            admin = User.create_user(
-                username='admin',
-                email='admin@nerostack.local',
-                password='admin123',
-                first_name='Admin',
-                last_name='NeroStack',
-                role='admin'
-            )
-            print(f"✅ Administrateur créé: {admin.username}")
-            print("   Email: admin@nerostack.local")
-            print("   Mot de passe: admin123")
-            print("   ⚠️  Changez ce mot de passe en production!")
-        else:
-            print(f"ℹ️  Administrateur existant: {admin.username}")
+        # Hashs calculés une seule fois, puis un unique INSERT ... ON CONFLICT
+        # DO NOTHING : les comptes déjà présents sont laissés intacts
+        rows = []
+        for account in DEFAULT_USERS:
+            row = {k: v for k, v in account.items() if k != 'password'}
+            row['password_hash'] = User.hash_password(account['password'])
+            row['is_active'] = True
+            rows.append(row)
         
-        # Créer un utilisateur de test
-        test_user = User.query.filter_by(username='testuser').first()
-        if not test_user:
-            test_user = User.create_user(
-                username='testuser',
-                email='test@nerostack.local',
-                password='test123',
-                first_name='Test',
-                last_name='User',
-                role='user'
-            )
-            print(f"✅ Utilisateur test créé: {test_user.username}")
-            print("   Email: test@nerostack.local")
-            print("   Mot de passe: test123")
-        else:
-            print(f"ℹ️  Utilisateur test existant: {test_user.username}")
+        stmt = (
+            postgresql.insert(User.__table__)
+            .values(rows)
+            .on_conflict_do_nothing()
+            .returning(User.__table__.c.username)
+        )
+        created = {r.username for r in db.session.execute(stmt)}
+        db.session.commit()
+        
+        for account in DEFAULT_USERS:
+            label = 'Administrateur' if account['role'] == 'admin' else 'Utilisateur test'
+            if account['username'] in created:
+                print(f"✅ {label} créé: {account['username']}")
+                print(f"   Email: {account['email']}")
+                print(f"   Mot de passe: {account['password']}")
+                if account['role'] == 'admin':
+                    print("   ⚠️  Changez ce mot de passe en production!")
+            else:
+                print(f"ℹ️  {label} existant: {account['username']}")
         
         print("\n✅ Initialisation terminée!")
 
 
 if __name__ == '__main__':
     init_database()
-
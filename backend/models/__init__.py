@@ -5,6 +5,15 @@ from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()
 
+
+def utc_now():
+    """
+    Horodatage calculé par PostgreSQL, en UTC sans fuseau (même convention
+    que datetime.utcnow() côté Python), pour server_default / onupdate.
+    """
+    return db.func.timezone('utc', db.func.now())
+
+
 from models.user import User
 from models.temporary_access import TemporaryAccess
 from models.document_analysis import DocumentAnalysis
@@ -1,9 +1,29 @@
 """
 Modèle DocumentAnalysis - Stockage des analyses IA des documents
 """
-from datetime import datetime
-from models import db
-import json
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+import orjson
+from flask import current_app
+from sqlalchemy.dialects import postgresql
+from models import db, utc_now
+from models.types import SmallEnum
+from utils.cache import cache_get, cache_set, cache_add, cache_delete
+
+
+def _analysis_cache_key(document_id: int, language: str, model: str) -> str:
+    return f"docai:{document_id}:{language}:{model}"
+
+
+def _inflight_key(document_id: int, language: str, model: str) -> str:
+    return f"inflight:docai:{document_id}:{language}:{model}"
+
+
+# Attente (secondes) de l'ID réel quand un autre processus vient de réserver
+# le marqueur « en cours » (valeur 0 le temps de créer son analyse)
+INFLIGHT_JOIN_WAIT = 2.0
+INFLIGHT_JOIN_POLL = 0.05
 
 
 class DocumentAnalysis(db.Model):
@@ -13,6 +33,16 @@ class DocumentAnalysis(db.Model):
     """
     
     __tablename__ = 'document_analyses'
+    # Récupère les valeurs calculées par la base (created_at...) via RETURNING
+    __mapper_args__ = {'eager_defaults': True}
+    __table_args__ = (
+        # Historique paginé par curseur (user_id, created_at, id)
+        db.Index('ix_analyses_user_created', 'user_id', db.text('created_at DESC'), db.text('id DESC')),
+        # Historique filtré par statut
+        db.Index('ix_analyses_user_status_created', 'user_id', 'status', db.text('created_at DESC')),
+        # Recherche par mots-clés côté serveur (opérateurs JSONB @>, ?)
+        db.Index('idx_analyses_keywords_gin', 'keywords', postgresql_using='gin'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -27,12 +57,13 @@ class DocumentAnalysis(db.Model):
     
     # Résultat de l'analyse
     summary = db.Column(db.Text, nullable=True)
-    keywords = db.Column(db.Text, nullable=True)  # Stocké en JSON
-    key_points = db.Column(db.Text, nullable=True)  # Stocké en JSON
+    keywords = db.Column(postgresql.JSONB, nullable=True)  # Liste de chaînes
+    key_points = db.Column(postgresql.JSONB, nullable=True)  # Liste de chaînes
     
     # Métadonnées de l'analyse
     model_used = db.Column(db.String(50), nullable=True)
-    analysis_type = db.Column(db.String(50), default='full', nullable=False)
+    analysis_type = db.Column(SmallEnum('full', 'summary', 'keywords', 'question'),
+                              default='full', nullable=False)
     language = db.Column(db.String(10), default='fr', nullable=False)
     
     # Statistiques
@@ -40,11 +71,12 @@ class DocumentAnalysis(db.Model):
     token_count = db.Column(db.Integer, nullable=True)
     
     # Statut: pending, processing, completed, failed
-    status = db.Column(db.String(20), default='pending', nullable=False)
+    status = db.Column(SmallEnum('pending', 'processing', 'completed', 'failed'),
+                       default='pending', nullable=False)
     error_message = db.Column(db.Text, nullable=True)
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=utc_now(), nullable=False)
     completed_at = db.Column(db.DateTime, nullable=True)
     
     def __repr__(self):
@@ -52,33 +84,26 @@ class DocumentAnalysis(db.Model):
     
     def get_keywords(self) -> list:
         """Retourne la liste des mots-clés"""
-        if self.keywords:
-            try:
-                return json.loads(self.keywords)
-            except json.JSONDecodeError:
-                return []
-        return []
+        return self.keywords or []
     
     def set_keywords(self, keywords: list) -> None:
         """Définit les mots-clés"""
-        self.keywords = json.dumps(keywords, ensure_ascii=False)
+        self.keywords = keywords
     
     def get_key_points(self) -> list:
         """Retourne la liste des points clés"""
-        if self.key_points:
-            try:
-                return json.loads(self.key_points)
-            except json.JSONDecodeError:
-                return []
-        return []
+        return self.key_points or []
     
     def set_key_points(self, key_points: list) -> None:
         """Définit les points clés"""
-        self.key_points = json.dumps(key_points, ensure_ascii=False)
+        self.key_points = key_points
     
     def mark_completed(self, summary: str, keywords: list, key_points: list, 
-                       processing_time: float = None) -> None:
-        """Marque l'analyse comme terminée"""
+                       processing_time: float = None, commit: bool = True) -> None:
+        """
+        Marque l'analyse comme terminée.
+        commit=False laisse la transaction à l'appelant (flux multi-étapes).
+        """
         self.summary = summary
         self.set_keywords(keywords)
         self.set_key_points(key_points)
@@ -86,14 +111,32 @@ class DocumentAnalysis(db.Model):
         self.completed_at = datetime.utcnow()
         if processing_time:
             self.processing_time = processing_time
-        db.session.commit()
+        if commit:
+            db.session.commit()
+            # Écriture immédiate dans le cache Redis des analyses
+            self.store_in_cache()
+            self.release_inflight()
+    
+    def store_in_cache(self) -> None:
+        """Met en cache Redis la version sérialisée de l'analyse terminée"""
+        cache_set(
+            _analysis_cache_key(self.document_id, self.language, self.model_used),
+            orjson.dumps(self.to_dict()),
+            current_app.config.get('ANALYSIS_CACHE_TTL', 86400)
+        )
     
-    def mark_failed(self, error_message: str) -> None:
+    def mark_failed(self, error_message: str, commit: bool = True) -> None:
         """Marque l'analyse comme échouée"""
         self.status = 'failed'
         self.error_message = error_message
         self.completed_at = datetime.utcnow()
-        db.session.commit()
+        if commit:
+            db.session.commit()
+            self.release_inflight()
+    
+    def release_inflight(self) -> None:
+        """Libère le marqueur « analyse en cours » (une nouvelle analyse peut partir)"""
+        cache_delete(_inflight_key(self.document_id, self.language, self.model_used))
     
     def to_dict(self) -> dict:
         """Convertit l'analyse en dictionnaire"""
@@ -103,8 +146,8 @@ class DocumentAnalysis(db.Model):
             'document_version': self.document_version,
             'user_id': self.user_id,
             'summary': self.summary,
-            'keywords': self.get_keywords(),
-            'key_points': self.get_key_points(),
+            'keywords': self.keywords or [],
+            'key_points': self.key_points or [],
             'model_used': self.model_used,
             'analysis_type': self.analysis_type,
             'language': self.language,
@@ -128,13 +171,108 @@ class DocumentAnalysis(db.Model):
         
         return query.order_by(DocumentAnalysis.created_at.desc()).first()
     
+    @staticmethod
+    def get_cached_analysis_dict(document_id: int, language: str, model: str) -> dict:
+        """
+        Dernière analyse terminée pour (document, langue, modèle), sérialisée.
+        Lit d'abord Redis ; en cas d'absence, interroge la base et remplit le cache.
+        """
+        cached = cache_get(_analysis_cache_key(document_id, language, model))
+        if cached is not None:
+            return orjson.loads(cached)
+        
+        analysis = DocumentAnalysis.query.filter(
+            DocumentAnalysis.document_id == document_id,
+            DocumentAnalysis.language == language,
+            DocumentAnalysis.model_used == model,
+            DocumentAnalysis.status == 'completed'
+        ).order_by(DocumentAnalysis.created_at.desc()).first()
+        if analysis is None:
+            return None
+        
+        analysis.store_in_cache()
+        return analysis.to_dict()
+    
+    @staticmethod
+    def _find_in_progress(document_id: int, language: str, model: str,
+                          ttl: int) -> Optional['DocumentAnalysis']:
+        """Analyse complète en file ou en cours, créée il y a moins de `ttl` secondes"""
+        return DocumentAnalysis.query.filter(
+            DocumentAnalysis.document_id == document_id,
+            DocumentAnalysis.language == language,
+            DocumentAnalysis.model_used == model,
+            DocumentAnalysis.analysis_type == 'full',
+            DocumentAnalysis.status.in_(('pending', 'processing')),
+            DocumentAnalysis.created_at >= datetime.utcnow() - timedelta(seconds=ttl)
+        ).order_by(DocumentAnalysis.created_at.desc()).first()
+    
+    @staticmethod
+    def start_or_join(document_id: int, user_id: int, model: str,
+                      language: str = 'fr') -> Tuple['DocumentAnalysis', bool]:
+        """
+        Regroupe les demandes identiques simultanées : si une analyse complète
+        du même (document, langue, modèle) est déjà en cours, elle est
+        retournée au lieu d'en lancer une seconde.
+        Un marqueur Redis (SET NX, valeur = ID de l'analyse) coordonne les
+        processus ; sans Redis, la base sert de référence.
+
+        Returns:
+            (analyse, True si elle vient d'être créée)
+        """
+        ttl = current_app.config.get('ANALYSIS_INFLIGHT_TTL', 600)
+        key = _inflight_key(document_id, language, model)
+        
+        def join(analysis_id) -> Optional['DocumentAnalysis']:
+            analysis = db.session.get(DocumentAnalysis, int(analysis_id))
+            if analysis is not None and analysis.status in ('pending', 'processing'):
+                return analysis
+            return None
+        
+        marker = cache_get(key)
+        existing = (join(marker) if marker and int(marker) else
+                    DocumentAnalysis._find_in_progress(document_id, language, model, ttl))
+        if existing is not None:
+            return existing, False
+        
+        if not cache_add(key, 0, ttl):
+            # Un autre processus vient de réserver la clé : attendre qu'il ait
+            # créé son analyse (marqueur = ID réel, ou ligne visible en base)
+            # et la rejoindre plutôt que d'en lancer une seconde
+            deadline = time.monotonic() + INFLIGHT_JOIN_WAIT
+            while True:
+                marker = cache_get(key)
+                if marker is None:
+                    break  # Réservation abandonnée : la reprendre
+                existing = (join(marker) if int(marker) else
+                            DocumentAnalysis._find_in_progress(document_id, language, model, ttl))
+                if existing is not None:
+                    return existing, False
+                if int(marker) or time.monotonic() >= deadline:
+                    break  # Analyse déjà terminée, ou réservation bloquée
+                time.sleep(INFLIGHT_JOIN_POLL)
+        
+        analysis = DocumentAnalysis.create_analysis(
+            document_id=document_id,
+            user_id=user_id,
+            model_used=model,
+            language=language
+        )
+        cache_set(key, analysis.id, ttl)
+        return analysis, True
+    
     @staticmethod
     def create_analysis(document_id: int, user_id: int, 
                         document_version: str = None,
                         model_used: str = None,
                         analysis_type: str = 'full',
-                        language: str = 'fr') -> 'DocumentAnalysis':
-        """Crée une nouvelle analyse"""
+                        language: str = 'fr',
+                        status: str = 'pending',
+                        commit: bool = True) -> 'DocumentAnalysis':
+        """
+        Crée une nouvelle analyse.
+        Avec commit=False, la ligne est seulement flushée (l'ID est disponible)
+        et l'appelant valide la transaction.
+        """
         analysis = DocumentAnalysis(
             document_id=document_id,
             user_id=user_id,
@@ -142,9 +280,12 @@ class DocumentAnalysis(db.Model):
             model_used=model_used,
             analysis_type=analysis_type,
             language=language,
-            status='pending'
+            status=status
         )
         db.session.add(analysis)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
         return analysis
 
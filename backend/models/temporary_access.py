@@ -2,7 +2,37 @@
 Modèle TemporaryAccess - Gestion des accès temporaires aux documents
 """
 from datetime import datetime
-from models import db
+from typing import FrozenSet, Optional, Tuple
+from functools import wraps
+from flask import current_app
+from sqlalchemy import select, case, func, literal, union_all
+from sqlalchemy.ext.hybrid import hybrid_method
+from models import db, utc_now
+from models.types import SmallEnum
+from utils.cache import cache_get, cache_set, cache_delete, cache_delete_pattern
+
+
+def _access_cache_key(user_id: int, document_id) -> str:
+    return f"acc:{user_id}:{document_id}"
+
+
+def _cached_access_decision(fn):
+    """
+    Met en cache Redis la décision d'accès (user_id, document_id) pour une
+    courte durée (ACCESS_CACHE_TTL). Invalidée à la création/révocation.
+    """
+    @wraps(fn)
+    def wrapper(user_id: int, document_id: int) -> bool:
+        key = _access_cache_key(user_id, document_id)
+        cached = cache_get(key)
+        if cached is not None:
+            return cached == b'1'
+        
+        allowed = fn(user_id, document_id)
+        cache_set(key, '1' if allowed else '0',
+                  current_app.config.get('ACCESS_CACHE_TTL', 45))
+        return allowed
+    return wrapper
 
 
 class TemporaryAccess(db.Model):
@@ -13,6 +43,22 @@ class TemporaryAccess(db.Model):
     """
     
     __tablename__ = 'temporary_accesses'
+    # Récupère les valeurs calculées par la base (created_at...) via RETURNING
+    __mapper_args__ = {'eager_defaults': True}
+    __table_args__ = (
+        # Requête chaude de vérification d'accès (check_document_access,
+        # get_effective_access) : index partiel sur les seuls accès actifs,
+        # couvrant (INCLUDE) pour un Index Only Scan
+        db.Index(
+            'ix_tempaccess_active_user_doc',
+            'user_id', 'document_id', 'start_date', 'end_date',
+            postgresql_where=db.text('is_active = true'),
+            postgresql_include=['id', 'access_type']
+        ),
+        db.Index('ix_tempaccess_user_doc', 'user_id', 'document_id'),
+        # Tri de list_accesses / my_accesses
+        db.Index('ix_tempaccess_user_created', 'user_id', db.text('created_at DESC')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -30,7 +76,7 @@ class TemporaryAccess(db.Model):
     end_date = db.Column(db.DateTime, nullable=False)
     
     # Type d'accès: read, write, admin
-    access_type = db.Column(db.String(20), default='read', nullable=False)
+    access_type = db.Column(SmallEnum('read', 'write', 'admin'), default='read', nullable=False)
     
     # Statut de l'accès
     is_active = db.Column(db.Boolean, default=True, nullable=False)
@@ -42,8 +88,8 @@ class TemporaryAccess(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utc_now(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=utc_now(), onupdate=utc_now())
     
     # Relation vers l'admin créateur
     creator = db.relationship('User', foreign_keys=[created_by], backref='created_accesses')
@@ -51,31 +97,56 @@ class TemporaryAccess(db.Model):
     def __repr__(self):
         return f'<TemporaryAccess user={self.user_id} doc={self.document_id}>'
     
-    def is_valid(self) -> bool:
+    # États de l'accès : méthodes hybrides, évaluées en Python sur une
+    # instance (TemporaryAccess().is_valid(now)) ou traduites en SQL sur la
+    # classe (filter(TemporaryAccess.is_valid(now))). Passer un `now` lu une
+    # seule fois par requête ; sans `now`, l'expression SQL utilise l'heure
+    # UTC du serveur de base de données.
+    
+    @hybrid_method
+    def is_valid(self, now: datetime = None) -> bool:
         """Vérifie si l'accès est actuellement valide"""
-        now = datetime.utcnow()
+        now = now or datetime.utcnow()
         return (
             self.is_active and 
             self.start_date <= now <= self.end_date
         )
     
-    def is_expired(self) -> bool:
+    @is_valid.inplace.expression
+    @classmethod
+    def _is_valid_expression(cls, now: datetime = None):
+        now = now if now is not None else utc_now()
+        return db.and_(cls.is_active.is_(True), cls.start_date <= now, cls.end_date >= now)
+    
+    @hybrid_method
+    def is_expired(self, now: datetime = None) -> bool:
         """Vérifie si l'accès a expiré"""
-        return datetime.utcnow() > self.end_date
+        return (now or datetime.utcnow()) > self.end_date
+    
+    @is_expired.inplace.expression
+    @classmethod
+    def _is_expired_expression(cls, now: datetime = None):
+        return cls.end_date < (now if now is not None else utc_now())
     
-    def is_pending(self) -> bool:
+    @hybrid_method
+    def is_pending(self, now: datetime = None) -> bool:
         """Vérifie si l'accès n'a pas encore commencé"""
-        return datetime.utcnow() < self.start_date
+        return (now or datetime.utcnow()) < self.start_date
     
-    def time_remaining(self) -> int:
+    @is_pending.inplace.expression
+    @classmethod
+    def _is_pending_expression(cls, now: datetime = None):
+        return cls.start_date > (now if now is not None else utc_now())
+    
+    def time_remaining(self, now: datetime = None) -> int:
         """Retourne le temps restant en secondes (0 si expiré)"""
-        if self.is_expired():
-            return 0
-        delta = self.end_date - datetime.utcnow()
-        return max(0, int(delta.total_seconds()))
+        now = now or datetime.utcnow()
+        return max(0, int((self.end_date - now).total_seconds()))
     
-    def to_dict(self) -> dict:
+    def to_dict(self, now: datetime = None) -> dict:
         """Convertit l'accès en dictionnaire"""
+        # Une seule lecture de l'horloge pour tous les indicateurs
+        now = now or datetime.utcnow()
         return {
             'id': self.id,
             'user_id': self.user_id,
@@ -85,45 +156,228 @@ class TemporaryAccess(db.Model):
             'end_date': self.end_date.isoformat() if self.end_date else None,
             'access_type': self.access_type,
             'is_active': self.is_active,
-            'is_valid': self.is_valid(),
-            'is_expired': self.is_expired(),
-            'is_pending': self.is_pending(),
-            'time_remaining': self.time_remaining(),
+            'is_valid': self.is_valid(now),
+            'is_expired': self.is_expired(now),
+            'is_pending': self.is_pending(now),
+            'time_remaining': self.time_remaining(now),
             'reason': self.reason,
             'created_by': self.created_by,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
     @staticmethod
-    def get_user_valid_accesses(user_id: int) -> list:
+    def get_user_valid_accesses(user_id: int, now: datetime = None) -> list:
         """Récupère tous les accès valides d'un utilisateur"""
-        now = datetime.utcnow()
+        now = now or datetime.utcnow()
         return TemporaryAccess.query.filter(
             TemporaryAccess.user_id == user_id,
-            TemporaryAccess.is_active == True,
-            TemporaryAccess.start_date <= now,
-            TemporaryAccess.end_date >= now
+            TemporaryAccess.is_valid(now)
+        ).all()
+    
+    @staticmethod
+    def get_allowed_doc_ids(user_id: int, now: datetime = None) -> Tuple[FrozenSet[int], bool]:
+        """
+        Documents couverts par les accès valides d'un utilisateur.
+        SELECT DISTINCT document_id (Index Only Scan sur
+        ix_tempaccess_active_user_doc), sans hydrater d'objets ORM.
+
+        Returns:
+            (IDs des documents autorisés, accès global présent)
+        """
+        now = now or datetime.utcnow()
+        doc_ids = db.session.scalars(
+            select(TemporaryAccess.document_id).distinct().where(
+                TemporaryAccess.user_id == user_id,
+                TemporaryAccess.is_valid(now)
+            )
+        ).all()
+        allowed = frozenset(doc_ids)
+        return allowed - {None}, None in allowed
+    
+    @staticmethod
+    def allowed_document_ids(user, loader=None) -> Optional[FrozenSet[int]]:
+        """
+        IDs des documents visibles par l'utilisateur, filtre id__in de la
+        liste Mayan (routes et préchargement appliquent la même règle).
+
+        Args:
+            user: Utilisateur (User)
+            loader: Lecture de (IDs autorisés, accès global) pour un user_id,
+                    par défaut get_allowed_doc_ids
+
+        Returns:
+            None si l'utilisateur voit tout (admin ou accès global), sinon
+            les IDs autorisés (éventuellement aucun)
+        """
+        if user.is_admin():
+            return None
+        doc_ids, has_global = (loader or TemporaryAccess.get_allowed_doc_ids)(user.id)
+        return None if has_global else doc_ids
+    
+    @staticmethod
+    def _dict_columns() -> tuple:
+        """Colonnes nécessaires à la sérialisation (mêmes clés que to_dict())"""
+        return (
+            TemporaryAccess.id,
+            TemporaryAccess.user_id,
+            TemporaryAccess.document_id,
+            TemporaryAccess.cabinet_id,
+            TemporaryAccess.start_date,
+            TemporaryAccess.end_date,
+            TemporaryAccess.access_type,
+            TemporaryAccess.is_active,
+            TemporaryAccess.reason,
+            TemporaryAccess.created_by,
+            TemporaryAccess.created_at
+        )
+    
+    @staticmethod
+    def _row_to_dict(r, now: datetime) -> dict:
+        """Sérialise une ligne Core issue de _dict_columns()"""
+        return {
+            'id': r.id,
+            'user_id': r.user_id,
+            'document_id': r.document_id,
+            'cabinet_id': r.cabinet_id,
+            'start_date': r.start_date.isoformat(),
+            'end_date': r.end_date.isoformat(),
+            'access_type': r.access_type,
+            'is_active': r.is_active,
+            'is_valid': r.is_active and r.start_date <= now <= r.end_date,
+            'is_expired': now > r.end_date,
+            'is_pending': now < r.start_date,
+            'time_remaining': max(0, int((r.end_date - now).total_seconds())),
+            'reason': r.reason,
+            'created_by': r.created_by,
+            'created_at': r.created_at.isoformat() if r.created_at else None
+        }
+    
+    @staticmethod
+    def list_for_user_dicts(user_id: int, valid_only: bool = False,
+                            now: datetime = None) -> list:
+        """
+        Liste les accès d'un utilisateur directement sous forme de dicts.
+        Passe par des lignes Core (select de colonnes) plutôt que par des
+        objets ORM : à utiliser pour les listes, to_dict() restant la
+        sérialisation des réponses unitaires. Mêmes clés que to_dict().
+        """
+        now = now or datetime.utcnow()
+        stmt = select(*TemporaryAccess._dict_columns()).where(
+            TemporaryAccess.user_id == user_id
+        )
+        
+        if valid_only:
+            stmt = stmt.where(TemporaryAccess.is_valid(now))
+        
+        rows = db.session.execute(stmt).all()
+        return [TemporaryAccess._row_to_dict(r, now) for r in rows]
+    
+    @staticmethod
+    def _bucket(now: datetime):
+        """Expression SQL classant un accès : revoked, expired, pending ou active"""
+        return case(
+            (TemporaryAccess.is_active.is_(False), 'revoked'),
+            (TemporaryAccess.is_expired(now), 'expired'),
+            (TemporaryAccess.is_pending(now), 'pending'),
+            else_='active'
+        )
+    
+    @staticmethod
+    def dashboard_counts(user_id: int, now: datetime = None) -> dict:
+        """Nombre d'accès par catégorie, en une requête GROUP BY"""
+        now = now or datetime.utcnow()
+        buckets = select(
+            TemporaryAccess._bucket(now).label('bucket')
+        ).where(TemporaryAccess.user_id == user_id).subquery()
+        rows = db.session.execute(
+            select(buckets.c.bucket, func.count()).group_by(buckets.c.bucket)
         ).all()
+        counts = dict.fromkeys(('active', 'pending', 'expired', 'revoked'), 0)
+        counts.update({b: n for b, n in rows})
+        return counts
+    
+    @staticmethod
+    def dashboard_items(user_id: int, limit: int, now: datetime = None) -> dict:
+        """
+        Accès par catégorie. Les accès actifs et en attente sont tous
+        renvoyés ; les historiques (expired, revoked) sont limités aux
+        `limit` plus récents.
+        """
+        now = now or datetime.utcnow()
+        bucket = TemporaryAccess._bucket(now)
+        ranked = select(
+            *TemporaryAccess._dict_columns(),
+            bucket.label('bucket'),
+            func.row_number().over(
+                partition_by=bucket,
+                order_by=TemporaryAccess.end_date.desc()
+            ).label('rank')
+        ).where(TemporaryAccess.user_id == user_id).subquery()
+        
+        rows = db.session.execute(
+            select(ranked).where(
+                db.or_(
+                    ranked.c.bucket.in_(('active', 'pending')),
+                    ranked.c.rank <= limit
+                )
+            ).order_by(ranked.c.bucket, ranked.c.rank)
+        ).all()
+        
+        items = {b: [] for b in ('active', 'pending', 'expired', 'revoked')}
+        for r in rows:
+            items[r.bucket].append(TemporaryAccess._row_to_dict(r, now))
+        return items
     
     @staticmethod
+    @_cached_access_decision
     def check_document_access(user_id: int, document_id: int) -> bool:
         """Vérifie si un utilisateur a accès à un document spécifique"""
-        now = datetime.utcnow()
-        
-        # Vérifier l'accès spécifique au document ou l'accès global
-        access = TemporaryAccess.query.filter(
-            TemporaryAccess.user_id == user_id,
-            TemporaryAccess.is_active == True,
-            TemporaryAccess.start_date <= now,
-            TemporaryAccess.end_date >= now,
-            db.or_(
-                TemporaryAccess.document_id == document_id,
-                TemporaryAccess.document_id == None  # Accès global
+        # Accès spécifique au document ou accès global
+        # (on ne charge que l'ID, inutile d'hydrater l'objet ORM)
+        access = db.session.execute(
+            TemporaryAccess._applicable_access(
+                (TemporaryAccess.id,), user_id, document_id, datetime.utcnow()
             )
         ).first()
         
         return access is not None
     
+    @staticmethod
+    def _applicable_access(columns, user_id: int, document_id: int, now: datetime):
+        """
+        Requête du premier accès valide applicable au document, l'accès
+        spécifique passant avant l'accès global.
+        Deux branches UNION ALL (document_id = :d, puis document_id IS NULL)
+        plutôt qu'un OR : chacune est une recherche d'égalité dans l'index
+        partiel ix_tempaccess_active_user_doc, LIMIT 1 par branche.
+        """
+        def branch(scope: int, document_filter):
+            return select(*columns, literal(scope).label('scope')).where(
+                TemporaryAccess.user_id == user_id,
+                TemporaryAccess.is_valid(now),
+                document_filter
+            ).limit(1)
+        
+        candidates = union_all(
+            branch(0, TemporaryAccess.document_id == document_id),
+            branch(1, TemporaryAccess.document_id.is_(None))  # Accès global
+        ).subquery()
+        return select(candidates).order_by(candidates.c.scope).limit(1)
+    
+    @staticmethod
+    def get_effective_access(user_id: int, document_id: int, now: datetime = None):
+        """
+        Retourne l'accès valide qui s'applique au document (ligne avec
+        id, access_type, end_date), ou None. Un accès spécifique au
+        document est préféré à un accès global.
+        """
+        return db.session.execute(
+            TemporaryAccess._applicable_access(
+                (TemporaryAccess.id, TemporaryAccess.access_type, TemporaryAccess.end_date),
+                user_id, document_id, now or datetime.utcnow()
+            )
+        ).first()
+    
     @staticmethod
     def create_access(
         user_id: int,
@@ -133,9 +387,14 @@ class TemporaryAccess(db.Model):
         document_id: int = None,
         cabinet_id: int = None,
         access_type: str = 'read',
-        reason: str = None
+        reason: str = None,
+        commit: bool = True
     ) -> 'TemporaryAccess':
-        """Crée un nouvel accès temporaire"""
+        """
+        Crée un nouvel accès temporaire.
+        Avec commit=False, la ligne est seulement flushée et l'appelant
+        valide la transaction.
+        """
         access = TemporaryAccess(
             user_id=user_id,
             document_id=document_id,
@@ -147,6 +406,28 @@ class TemporaryAccess(db.Model):
             created_by=created_by
         )
         db.session.add(access)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+        TemporaryAccess.invalidate_access_cache(user_id, document_id)
         return access
+    
+    def revoke(self) -> None:
+        """Révoque (désactive) l'accès sans le supprimer"""
+        self.is_active = False
+        db.session.commit()
+        TemporaryAccess.invalidate_access_cache(self.user_id, self.document_id)
+    
+    @staticmethod
+    def invalidate_access_cache(user_id: int, document_id: int = None) -> None:
+        """
+        Invalide les décisions d'accès en cache.
+        Un accès global (document_id = None) concerne tous les documents
+        de l'utilisateur : toutes ses entrées sont supprimées.
+        """
+        if document_id is None:
+            cache_delete_pattern(_access_cache_key(user_id, '*'))
+        else:
+            cache_delete(_access_cache_key(user_id, document_id))
 
@@ -0,0 +1,50 @@
+"""
+Types de colonnes personnalisés
+"""
+from sqlalchemy.types import TypeDecorator, SmallInteger
+
+
+class SmallEnum(TypeDecorator):
+    """
+    Énumération de chaînes stockée en SMALLINT.
+    Le code Python continue de manipuler les chaînes ('completed', 'admin'...)
+    tandis que la base compare et indexe des entiers sur 2 octets.
+
+    L'ordre des valeurs fixe leur code : n'ajouter de nouvelles valeurs
+    qu'en fin de liste.
+
+    Écrire une valeur inconnue lève ValueError ; seules les comparaisons
+    (filtres) la tolèrent, voir coerce_compared_value.
+    """
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, *values: str, strict: bool = True):
+        super().__init__()
+        self.values = tuple(values)
+        self.strict = strict
+        self._codes = {value: code for code, value in enumerate(self.values)}
+        self._compared = None
+
+    def coerce_compared_value(self, op, value):
+        # Valeur comparée à la colonne (filtre issu d'un paramètre d'URL) :
+        # une valeur inconnue y devient un code impossible, la requête ne
+        # renvoie simplement aucune ligne
+        if self._compared is None:
+            self._compared = self if not self.strict else SmallEnum(*self.values, strict=False)
+        return self._compared
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        code = self._codes.get(value)
+        if code is None:
+            if self.strict:
+                raise ValueError(f"Valeur inconnue {value!r}, attendu : {', '.join(self.values)}")
+            return -1
+        return code
+
+    def process_result_value(self, value, dialect):
+        if value is None or not 0 <= value < len(self.values):
+            return None
+        return self.values[value]
@@ -2,26 +2,39 @@
 Modèle User - Gestion des utilisateurs
 """
 from datetime import datetime
-from models import db
+from typing import Optional
+from flask import current_app
+from sqlalchemy import DDL, event, select, update, exists, literal, union_all
+from models import db, utc_now
+from models.types import SmallEnum
 import bcrypt
 
 
+# Messages d'erreur des conflits d'unicité (voir User.find_conflict)
+CONFLICT_MESSAGES = {
+    'username': 'Ce nom d\'utilisateur est déjà utilisé',
+    'email': 'Cet email est déjà utilisé',
+}
+
+
 class User(db.Model):
     """Modèle utilisateur pour l'authentification"""
     
     __tablename__ = 'users'
+    # Récupère les valeurs calculées par la base (created_at...) via RETURNING
+    __mapper_args__ = {'eager_defaults': True}
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False, index=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.LargeBinary(60), nullable=False)  # Hash bcrypt brut
     
     # Informations utilisateur
     first_name = db.Column(db.String(50), nullable=True)
     last_name = db.Column(db.String(50), nullable=True)
     
     # Rôle: admin ou user
-    role = db.Column(db.String(20), default='user', nullable=False)
+    role = db.Column(SmallEnum('user', 'admin'), default='user', nullable=False)
     
     # Statut du compte
     is_active = db.Column(db.Boolean, default=True, nullable=False)
@@ -31,37 +44,66 @@ class User(db.Model):
     mayan_user_id = db.Column(db.Integer, nullable=True)
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utc_now(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=utc_now(), onupdate=utc_now())
     last_login = db.Column(db.DateTime, nullable=True)
     
-    # Relations
-    temporary_accesses = db.relationship('TemporaryAccess', foreign_keys='TemporaryAccess.user_id', backref='user', lazy='dynamic')
-    document_analyses = db.relationship('DocumentAnalysis', backref='user', lazy='dynamic')
+    # Recherche insensible à la casse (LOWER(...)) servie par un index
+    __table_args__ = (
+        db.Index('ix_users_username_lower', db.func.lower(username), unique=True),
+        db.Index('ix_users_email_lower', db.func.lower(email), unique=True),
+        # Recherche ILIKE '%...%' de list_users : index trigrammes (pg_trgm)
+        db.Index('ix_users_username_trgm', username,
+                 postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'}),
+        db.Index('ix_users_email_trgm', email,
+                 postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'}),
+    )
+    
+    # Relations (chargement à la demande ; pour une liste d'utilisateurs,
+    # utiliser selectinload(User.temporary_accesses) plutôt qu'un accès par ligne)
+    temporary_accesses = db.relationship('TemporaryAccess', foreign_keys='TemporaryAccess.user_id', backref='user')
+    document_analyses = db.relationship('DocumentAnalysis', backref='user')
     
     def __repr__(self):
         return f'<User {self.username}>'
     
+    @staticmethod
+    def hash_password(password: str) -> bytes:
+        """Calcule le hash bcrypt d'un mot de passe (coût BCRYPT_ROUNDS)"""
+        salt = bcrypt.gensalt(current_app.config.get('BCRYPT_ROUNDS', 12))
+        return bcrypt.hashpw(password.encode('utf-8'), salt)
+    
     def set_password(self, password: str) -> None:
         """Hash et stocke le mot de passe"""
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        self.password_hash = User.hash_password(password)
     
     def check_password(self, password: str) -> bool:
-        """Vérifie le mot de passe"""
-        return bcrypt.checkpw(
-            password.encode('utf-8'), 
-            self.password_hash.encode('utf-8')
-        )
+        """
+        Vérifie le mot de passe.
+        bcrypt (extension native) libère le GIL pendant le calcul : les
+        autres threads du worker continuent de servir leurs requêtes.
+        """
+        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash)
+    
+    def needs_rehash(self) -> bool:
+        """Le hash a été calculé avec un coût différent de BCRYPT_ROUNDS"""
+        # Format bcrypt : $2b$<coût sur 2 chiffres>$<sel+hash>
+        rounds = int(self.password_hash[4:6])
+        return rounds != current_app.config.get('BCRYPT_ROUNDS', 12)
     
     def is_admin(self) -> bool:
         """Vérifie si l'utilisateur est admin"""
         return self.role == 'admin'
     
-    def update_last_login(self) -> None:
+    def token_claims(self) -> dict:
+        """Claims ajoutés au token d'accès (évite de relire l'utilisateur)"""
+        return {'is_admin': self.is_admin(), 'role': self.role}
+    
+    def update_last_login(self, commit: bool = True) -> None:
         """Met à jour la date de dernière connexion"""
         self.last_login = datetime.utcnow()
-        db.session.commit()
+        if commit:
+            db.session.commit()
     
     def to_dict(self, include_sensitive: bool = False) -> dict:
         """Convertit l'utilisateur en dictionnaire"""
@@ -83,8 +125,108 @@ class User(db.Model):
         return data
     
     @staticmethod
-    def create_user(username: str, email: str, password: str, **kwargs) -> 'User':
-        """Crée un nouvel utilisateur"""
+    def set_active(user_id: int, active: bool) -> Optional[dict]:
+        """
+        Active ou désactive un compte en un seul UPDATE ... RETURNING,
+        sans charger l'objet ORM. La transaction est validée.
+
+        Returns:
+            L'utilisateur mis à jour (mêmes clés que to_dict()), ou None
+        """
+        row = db.session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(is_active=active)
+            .returning(
+                User.id, User.username, User.email, User.first_name,
+                User.last_name, User.role, User.is_active,
+                User.created_at, User.last_login
+            )
+        ).first()
+        if row is None:
+            db.session.rollback()
+            return None
+        db.session.commit()
+        return {
+            'id': row.id,
+            'username': row.username,
+            'email': row.email,
+            'first_name': row.first_name,
+            'last_name': row.last_name,
+            'role': row.role,
+            'is_active': row.is_active,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'last_login': row.last_login.isoformat() if row.last_login else None
+        }
+    
+    @staticmethod
+    def find_by_username(username: str) -> 'User':
+        """Recherche un utilisateur par username (insensible à la casse)"""
+        return User.query.filter(
+            db.func.lower(User.username) == username.lower()
+        ).first()
+    
+    @staticmethod
+    def find_by_email(email: str) -> 'User':
+        """Recherche un utilisateur par email (insensible à la casse)"""
+        return User.query.filter(
+            db.func.lower(User.email) == email.lower()
+        ).first()
+    
+    @staticmethod
+    def find_by_login(identifier: str) -> 'User':
+        """
+        Recherche un utilisateur par username ou email (insensible à la casse).
+        Sans '@', l'identifiant ne peut pas être un email : seul l'index
+        du username est consulté. Sinon, UNION ALL de deux recherches
+        d'égalité (chacune sur son index unique) plutôt qu'un OR, le
+        username l'emportant en cas de double correspondance.
+        """
+        if '@' not in identifier:
+            return User.find_by_username(identifier)
+        
+        identifier = identifier.lower()
+        matches = union_all(
+            select(User.id, literal(0).label('rank'))
+            .where(db.func.lower(User.username) == identifier),
+            select(User.id, literal(1).label('rank'))
+            .where(db.func.lower(User.email) == identifier)
+        ).subquery()
+        return User.query.join(matches, User.id == matches.c.id).order_by(matches.c.rank).first()
+    
+    @staticmethod
+    def email_taken(email: str) -> bool:
+        """Email déjà utilisé (SELECT EXISTS sur l'index, sans charger de ligne)"""
+        return db.session.execute(
+            select(exists().where(db.func.lower(User.email) == email.lower()))
+        ).scalar()
+    
+    @staticmethod
+    def find_conflict(username: str, email: str) -> str:
+        """
+        Vérifie en une requête si le username ou l'email est déjà pris.
+        
+        Returns:
+            'username', 'email' ou None
+        """
+        taken = union_all(
+            select(literal('username').label('field'), literal(0).label('rank'))
+            .where(db.func.lower(User.username) == username.lower()),
+            select(literal('email').label('field'), literal(1).label('rank'))
+            .where(db.func.lower(User.email) == email.lower())
+        ).subquery()
+        return db.session.execute(
+            select(taken.c.field).order_by(taken.c.rank).limit(1)
+        ).scalar()
+    
+    @staticmethod
+    def create_user(username: str, email: str, password: str,
+                    commit: bool = True, **kwargs) -> 'User':
+        """
+        Crée un nouvel utilisateur.
+        Avec commit=False, la ligne est seulement flushée (l'ID est disponible)
+        et l'appelant valide la transaction.
+        """
         user = User(
             username=username,
             email=email,
@@ -92,6 +234,17 @@ class User(db.Model):
         )
         user.set_password(password)
         db.session.add(user)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
         return user
 
+
+
+# Extension requise par les index trigrammes, créée avant la table (PostgreSQL)
+event.listen(
+    User.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
@@ -1,12 +1,23 @@
 """
 Routes de l'application
+Les blueprints sont importés à la demande (voir BLUEPRINTS dans app.py) :
+importer un seul module de routes ne charge pas les autres.
 """
-from routes.auth import auth_bp
-from routes.users import users_bp
-from routes.documents import documents_bp
-from routes.access import access_bp
-from routes.ai import ai_bp
-from routes.health import health_bp
+import importlib
 
-__all__ = ['auth_bp', 'users_bp', 'documents_bp', 'access_bp', 'ai_bp', 'health_bp']
+_BLUEPRINT_MODULES = {
+    'auth_bp': 'routes.auth',
+    'users_bp': 'routes.users',
+    'documents_bp': 'routes.documents',
+    'access_bp': 'routes.access',
+    'ai_bp': 'routes.ai',
+    'health_bp': 'routes.health',
+}
 
+__all__ = list(_BLUEPRINT_MODULES)
+
+
+def __getattr__(name: str):
+    if name in _BLUEPRINT_MODULES:
+        return getattr(importlib.import_module(_BLUEPRINT_MODULES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
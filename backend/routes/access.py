@@ -2,12 +2,15 @@
 Routes de gestion des accès temporaires
 Permet aux admins de définir des fenêtres d'accès pour les utilisateurs
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from marshmallow import Schema, fields, validate, ValidationError
+from marshmallow import Schema, fields, validate, ValidationError, post_dump
+from sqlalchemy.orm import joinedload, raiseload
 from models import db
 from models.user import User
 from models.temporary_access import TemporaryAccess
+from utils.roles import current_user_is_admin
+from utils.pagination import paginate, page_args
 from datetime import datetime
 from functools import wraps
 import logging
@@ -17,6 +20,21 @@ logger = logging.getLogger(__name__)
 access_bp = Blueprint('access', __name__, url_prefix='/api/access')
 
 
+# =========== Utilitaires ===========
+
+def load_options(*options) -> list:
+    """
+    Options de chargement d'une requête TemporaryAccess.
+    Avec SQLALCHEMY_RAISELOAD (développement, tests), toute relation non
+    chargée explicitement lève une erreur au lieu d'un SELECT paresseux :
+    un N+1 introduit par erreur échoue immédiatement.
+    """
+    options = list(options)
+    if current_app.config.get('SQLALCHEMY_RAISELOAD', False):
+        options.append(raiseload('*'))
+    return options
+
+
 # =========== Décorateurs ===========
 
 def admin_required(fn):
@@ -24,10 +42,8 @@ def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user or not user.is_admin():
+        # Claim du token ; base de données seulement pour les anciens tokens
+        if not current_user_is_admin():
             return jsonify({'error': 'Accès refusé. Droits administrateur requis.'}), 403
         
         return fn(*args, **kwargs)
@@ -59,6 +75,53 @@ class UpdateAccessSchema(Schema):
     reason = fields.String(validate=validate.Length(max=500))
 
 
+class AccessUserDumpSchema(Schema):
+    """Utilisateur résumé joint aux accès listés"""
+    id = fields.Integer()
+    username = fields.String()
+    email = fields.String()
+
+
+class AccessDumpSchema(Schema):
+    """
+    Sérialisation des listes d'accès (mêmes clés et même format de date
+    ISO 8601 que TemporaryAccess.to_dict()).
+    """
+    id = fields.Integer()
+    user_id = fields.Integer()
+    document_id = fields.Integer()
+    cabinet_id = fields.Integer()
+    start_date = fields.DateTime(format='iso')
+    end_date = fields.DateTime(format='iso')
+    access_type = fields.String()
+    is_active = fields.Boolean()
+    reason = fields.String()
+    created_by = fields.Integer()
+    created_at = fields.DateTime(format='iso')
+    user = fields.Nested(AccessUserDumpSchema)
+
+    @post_dump(pass_many=True)
+    def add_status(self, data, many, **kwargs):
+        """Indicateurs de validité, avec une seule lecture de l'horloge par liste"""
+        now = datetime.utcnow()
+        for item in (data if many else [data]):
+            start = datetime.fromisoformat(item['start_date'])
+            end = datetime.fromisoformat(item['end_date'])
+            item['is_valid'] = item['is_active'] and start <= now <= end
+            item['is_expired'] = now > end
+            item['is_pending'] = now < start
+            item['time_remaining'] = max(0, int((end - now).total_seconds()))
+            if item.get('user') is None:
+                item.pop('user', None)
+        return data
+
+
+# Instances partagées (les schémas marshmallow sont sans état)
+create_access_schema = CreateAccessSchema()
+update_access_schema = UpdateAccessSchema()
+access_list_dump = AccessDumpSchema(many=True)
+
+
 # =========== Routes Admin ===========
 
 @access_bp.route('', methods=['GET'])
@@ -70,6 +133,8 @@ def list_accesses():
     Query params:
         page: Numéro de page
         per_page: Éléments par page
+        cursor: Curseur de la page suivante (next_cursor), remplace page
+        exact_total: false pour omettre total/pages (pas de COUNT)
         user_id: Filtrer par utilisateur
         document_id: Filtrer par document
         active: Filtrer par statut actif (true/false)
@@ -78,14 +143,14 @@ def list_accesses():
     Returns:
         200: Liste paginée des accès
     """
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    page, per_page = page_args()
     user_id = request.args.get('user_id', type=int)
     document_id = request.args.get('document_id', type=int)
     active = request.args.get('active')
     valid = request.args.get('valid')
     
-    query = TemporaryAccess.query
+    # Utilisateur chargé dans la même requête (JOIN) plutôt qu'un SELECT par ligne
+    query = TemporaryAccess.query.options(*load_options(joinedload(TemporaryAccess.user)))
     
     # Filtres
     if user_id:
@@ -106,31 +171,16 @@ def list_accesses():
             TemporaryAccess.end_date >= now
         )
     
-    # Pagination
-    pagination = query.order_by(TemporaryAccess.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    # Enrichir avec les infos utilisateur
-    accesses = []
-    for access in pagination.items:
-        access_dict = access.to_dict()
-        user = User.query.get(access.user_id)
-        if user:
-            access_dict['user'] = {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email
-            }
-        accesses.append(access_dict)
-    
-    return jsonify({
-        'accesses': accesses,
-        'total': pagination.total,
-        'page': page,
-        'per_page': per_page,
-        'pages': pagination.pages
-    }), 200
+    # Pagination (curseur si fourni, sinon numéro de page)
+    try:
+        items, meta = paginate(query, TemporaryAccess, page, per_page,
+                               cursor=request.args.get('cursor'),
+                               exact_total=request.args.get('exact_total', 'true').lower() != 'false')
+    except ValueError:
+        return jsonify({'error': 'Curseur invalide'}), 400
+    
+    # Sérialisation de la page en un seul appel (utilisateur joint inclus)
+    return jsonify({'accesses': access_list_dump.dump(items), **meta}), 200
 
 
 @access_bp.route('/<int:access_id>', methods=['GET'])
@@ -143,7 +193,10 @@ def get_access(access_id):
         200: Détails de l'accès
         404: Accès non trouvé
     """
-    access = TemporaryAccess.query.get(access_id)
+    access = db.session.get(
+        TemporaryAccess, access_id,
+        options=load_options(joinedload(TemporaryAccess.user))
+    )
     
     if not access:
         return jsonify({'error': 'Accès non trouvé'}), 404
@@ -151,7 +204,7 @@ def get_access(access_id):
     access_dict = access.to_dict()
     
     # Ajouter les infos utilisateur
-    user = User.query.get(access.user_id)
+    user = access.user
     if user:
         access_dict['user'] = user.to_dict()
     
@@ -179,12 +232,12 @@ def create_access():
         404: Utilisateur non trouvé
     """
     try:
-        data = CreateAccessSchema().load(request.json)
+        data = create_access_schema.load(request.get_json(silent=True) or {})
     except ValidationError as e:
         return jsonify({'error': 'Données invalides', 'details': e.messages}), 400
     
     # Vérifier que l'utilisateur existe
-    user = User.query.get(data['user_id'])
+    user = db.session.get(User, data['user_id'])
     if not user:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
     
@@ -211,9 +264,9 @@ def create_access():
             'access': access.to_dict()
         }), 201
         
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        logger.error(f"Erreur création accès: {e}")
+        logger.exception("Erreur création accès")
         return jsonify({'error': 'Erreur lors de la création'}), 500
 
 
@@ -241,7 +294,7 @@ def update_access(access_id):
         return jsonify({'error': 'Accès non trouvé'}), 404
     
     try:
-        data = UpdateAccessSchema().load(request.json)
+        data = update_access_schema.load(request.get_json(silent=True) or {})
     except ValidationError as e:
         return jsonify({'error': 'Données invalides', 'details': e.messages}), 400
     
@@ -256,6 +309,7 @@ def update_access(access_id):
         setattr(access, key, value)
     
     db.session.commit()
+    TemporaryAccess.invalidate_access_cache(access.user_id, access.document_id)
     
     return jsonify({
         'message': 'Accès mis à jour',
@@ -278,8 +332,10 @@ def delete_access(access_id):
     if not access:
         return jsonify({'error': 'Accès non trouvé'}), 404
     
+    user_id, document_id = access.user_id, access.document_id
     db.session.delete(access)
     db.session.commit()
+    TemporaryAccess.invalidate_access_cache(user_id, document_id)
     
     return jsonify({'message': 'Accès supprimé'}), 200
 
@@ -299,8 +355,7 @@ def revoke_access(access_id):
     if not access:
         return jsonify({'error': 'Accès non trouvé'}), 404
     
-    access.is_active = False
-    db.session.commit()
+    access.revoke()
     
     return jsonify({
         'message': 'Accès révoqué',
@@ -325,13 +380,10 @@ def my_accesses():
     user_id = get_jwt_identity()
     valid_only = request.args.get('valid_only', 'false').lower() == 'true'
     
-    if valid_only:
-        accesses = TemporaryAccess.get_user_valid_accesses(user_id)
-    else:
-        accesses = TemporaryAccess.query.filter_by(user_id=user_id).all()
+    accesses = TemporaryAccess.list_for_user_dicts(user_id, valid_only=valid_only)
     
     return jsonify({
-        'accesses': [a.to_dict() for a in accesses]
+        'accesses': accesses
     }), 200
 
 
@@ -345,39 +397,26 @@ def check_access(document_id):
         200: Résultat de la vérification
     """
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
     
     # Les admins ont toujours accès
-    if user.is_admin():
+    if current_user_is_admin():
         return jsonify({
             'has_access': True,
             'reason': 'admin',
             'access_type': 'admin'
         }), 200
     
-    # Vérifier l'accès temporaire
-    has_access = TemporaryAccess.check_document_access(user_id, document_id)
+    # Vérifier l'accès temporaire et récupérer ses détails en une requête
+    now = datetime.utcnow()
+    access = TemporaryAccess.get_effective_access(user_id, document_id, now)
     
-    if has_access:
-        # Récupérer les détails de l'accès
-        now = datetime.utcnow()
-        access = TemporaryAccess.query.filter(
-            TemporaryAccess.user_id == user_id,
-            TemporaryAccess.is_active == True,
-            TemporaryAccess.start_date <= now,
-            TemporaryAccess.end_date >= now,
-            db.or_(
-                TemporaryAccess.document_id == document_id,
-                TemporaryAccess.document_id == None
-            )
-        ).first()
-        
+    if access:
         return jsonify({
             'has_access': True,
             'reason': 'temporary_access',
-            'access_type': access.access_type if access else 'read',
-            'expires_at': access.end_date.isoformat() if access else None,
-            'time_remaining': access.time_remaining() if access else 0
+            'access_type': access.access_type,
+            'expires_at': access.end_date.isoformat(),
+            'time_remaining': max(0, int((access.end_date - now).total_seconds()))
         }), 200
     
     return jsonify({
@@ -393,49 +432,28 @@ def access_dashboard():
     Tableau de bord des accès pour l'utilisateur.
     Montre les accès actifs, en attente et expirés.
     
+    Query params:
+        limit: Nombre maximal d'accès expirés / révoqués listés (défaut: 20)
+    
     Returns:
         200: Statistiques des accès
     """
     user_id = get_jwt_identity()
     now = datetime.utcnow()
+    limit = min(request.args.get('limit', 20, type=int), 100)
     
-    # Tous les accès de l'utilisateur
-    all_accesses = TemporaryAccess.query.filter_by(user_id=user_id).all()
-    
-    active = []
-    pending = []
-    expired = []
-    revoked = []
+    # Comptage par catégorie en SQL (GROUP BY), puis les lignes à afficher
+    counts = TemporaryAccess.dashboard_counts(user_id, now)
+    items = TemporaryAccess.dashboard_items(user_id, limit, now)
     
-    for access in all_accesses:
-        if not access.is_active:
-            revoked.append(access.to_dict())
-        elif access.is_expired():
-            expired.append(access.to_dict())
-        elif access.is_pending():
-            pending.append(access.to_dict())
-        elif access.is_valid():
-            active.append(access.to_dict())
-    
-    return jsonify({
-        'dashboard': {
-            'active': {
-                'count': len(active),
-                'accesses': active
-            },
-            'pending': {
-                'count': len(pending),
-                'accesses': pending
-            },
-            'expired': {
-                'count': len(expired),
-                'accesses': expired
-            },
-            'revoked': {
-                'count': len(revoked),
-                'accesses': revoked
-            },
-            'total': len(all_accesses)
+    dashboard = {
+        bucket: {
+            'count': counts[bucket],
+            'accesses': items[bucket]
         }
-    }), 200
+        for bucket in ('active', 'pending', 'expired', 'revoked')
+    }
+    dashboard['total'] = sum(counts.values())
+    
+    return jsonify({'dashboard': dashboard}), 200
 
@@ -2,26 +2,161 @@
 Routes pour l'analyse IA des documents
 Utilise Ollama pour générer des résumés et extraire les informations clés
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app, url_for, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from marshmallow import Schema, fields
 from models import db
 from models.user import User
 from models.temporary_access import TemporaryAccess
 from models.document_analysis import DocumentAnalysis
-from services.mayan_service import MayanService
-from services.ai_service import AIService
+from utils.cache import cache_endpoint, cache_get, cache_set
+from utils.pagination import paginate, page_args
+from services import shared_mayan_service, shared_ai_service
+from tasks.analysis import run_analysis
+from sqlalchemy import select
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hashlib
 import logging
-import requests
+import orjson
 logger = logging.getLogger(__name__)
 
+# Threads partagés pour paralléliser les appels réseau indépendants d'une requête
+_io_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ai-io')
+
 ai_bp = Blueprint('ai', __name__, url_prefix='/api/ai')
 
 
-def check_document_access(user: User, document_id: int) -> bool:
-    """Vérifie l'accès de l'utilisateur au document"""
-    if user.is_admin():
-        return True
-    return TemporaryAccess.check_document_access(user.id, document_id)
+def authorize_document(user_id: int, document_id: int):
+    """
+    Vérifie l'accès de l'utilisateur au document en un seul SELECT :
+    rôle admin OU accès temporaire valide (EXISTS).
+
+    Returns:
+        Ligne (id, mayan_token) si l'accès est autorisé, None sinon
+    """
+    now = datetime.utcnow()
+
+    # Un EXISTS par portée (document puis global) plutôt qu'un OR sur
+    # document_id : chacun est une recherche d'égalité dans l'index partiel
+    def has_access(document_filter):
+        return select(TemporaryAccess.id).where(
+            TemporaryAccess.user_id == User.id,
+            TemporaryAccess.is_valid(now),
+            document_filter
+        ).exists()
+
+    row = db.session.execute(
+        select(
+            User.id,
+            User.mayan_token,
+            db.or_(
+                User.role == 'admin',
+                has_access(TemporaryAccess.document_id == document_id),
+                has_access(TemporaryAccess.document_id.is_(None))
+            ).label('allowed')
+        ).where(User.id == user_id)
+    ).first()
+
+    return row if row is not None and row.allowed else None
+
+
+def load_content_for_ai(document_id: int, token: str):
+    """
+    Récupère le contenu du document (Mayan) et teste la connexion à Ollama
+    en parallèle : les deux appels sont indépendants, la requête n'attend
+    que le plus lent des deux au lieu de leur somme.
+
+    Returns:
+        Tuple (AIService, contenu ou None, Ollama joignable)
+    """
+    mayan = shared_mayan_service()
+    ai = shared_ai_service()
+    # Le contenu est lu via le cache Redis de l'application : le thread
+    # s'exécute dans un contexte applicatif
+    app = current_app._get_current_object()
+
+    def fetch_content():
+        with app.app_context():
+            return mayan.get_document_content(document_id, token=token)
+
+    f_content = _io_pool.submit(fetch_content)
+    f_connected = _io_pool.submit(ai.check_connection)
+    return ai, f_content.result(), f_connected.result()
+
+
+def llm_cache_key(task: str, model: str, language: str, content: str, *params) -> str:
+    """
+    Clé du cache des générations : empreinte SHA-256 du modèle, de la langue,
+    des paramètres de la tâche et du contenu. Deux documents au contenu
+    identique partagent la même entrée.
+    """
+    parts = '\x1f'.join((model, language, task, *map(str, params), content))
+    return f"llm:{task}:{hashlib.sha256(parts.encode()).hexdigest()}"
+
+
+def wants_stream() -> bool:
+    """Le client demande une réponse en flux (Accept: text/event-stream)"""
+    return request.accept_mimetypes.best == 'text/event-stream'
+
+
+def sse_response(tokens, on_complete=None, **extra) -> Response:
+    """
+    Relaie les fragments générés par Ollama en Server-Sent Events :
+    un événement `data: {"token": ...}` par fragment, puis `event: done`
+    (avec `extra`) ou `event: error`. `on_complete` reçoit le texte
+    complet (non vide) une fois le flux terminé sans erreur.
+    """
+    def events():
+        try:
+            parts = []
+            for token in tokens:
+                parts.append(token)
+                yield b'data: ' + orjson.dumps({'token': token}) + b'\n\n'
+            text = ''.join(parts).strip()
+            if on_complete is not None and text:
+                on_complete(text)
+            yield b'event: done\ndata: ' + orjson.dumps(extra) + b'\n\n'
+        except Exception:
+            logger.exception("Erreur flux IA")
+            yield b'event: error\ndata: ' + orjson.dumps({'error': 'Génération interrompue'}) + b'\n\n'
+
+    # Rendre la connexion PostgreSQL au pool avant la génération : le flux
+    # n'utilise plus la base (contrôles d'accès déjà faits)
+    db.session.commit()
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+# =========== Schémas ===========
+
+class AnalysisDumpSchema(Schema):
+    """
+    Sérialisation des listes d'analyses (mêmes clés et même format de date
+    ISO 8601 que DocumentAnalysis.to_dict()).
+    """
+    id = fields.Integer()
+    document_id = fields.Integer()
+    document_version = fields.String()
+    user_id = fields.Integer()
+    summary = fields.String()
+    keywords = fields.Function(lambda a: a.keywords or [])
+    key_points = fields.Function(lambda a: a.key_points or [])
+    model_used = fields.String()
+    analysis_type = fields.String()
+    language = fields.String()
+    processing_time = fields.Float()
+    status = fields.String()
+    error_message = fields.String()
+    created_at = fields.DateTime(format='iso')
+    completed_at = fields.DateTime(format='iso')
+
+
+# Instance partagée (les schémas marshmallow sont sans état)
+analysis_list_dump = AnalysisDumpSchema(many=True)
 
 
 # =========== Routes ===========
@@ -32,87 +167,63 @@ def analyze_document(document_id):
     """
     Lance une analyse IA complète d'un document.
     Génère: résumé, mots-clés, points clés.
+    L'analyse est exécutée en arrière-plan : suivre son avancement via
+    GET /api/ai/analysis/<id>.
 
-    Body JSON (optionnel):
+    Query params (optionnel):
         language: Langue du document (fr, en) - défaut: fr
         force_refresh: Ignorer le cache (défaut: false)
 
     Returns:
-        200: Résultat de l'analyse
+        200: Analyse déjà disponible (cache)
+        202: Analyse en file d'attente
         403: Accès refusé
-        404: Document non trouvé
-        503: Service IA indisponible
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-
     # Vérifier l'accès
-    if not check_document_access(user, document_id):
+    user = authorize_document(get_jwt_identity(), document_id)
+    if user is None:
         return jsonify({
             'error': 'Accès refusé',
             'message': 'Vous n\'avez pas accès à ce document'
         }), 403
 
+    language = request.args.get('language', 'fr')
+    model = current_app.config.get('OLLAMA_MODEL')
+    force_refresh = request.args.get('force_refresh', 'false').lower() == 'true'
 
-    # Récupérer le contenu du document
-    mayan = MayanService()
-    content = mayan.get_document_content(document_id, token=user.mayan_token)
-    if not content:
-        return jsonify({
-            'error': 'Contenu non disponible',
-            'message': 'Impossible de récupérer le contenu du document. OCR peut-être en cours.'
-        }), 404
+    # Analyse déjà réalisée pour ce document (Redis, puis base)
+    if not force_refresh:
+        cached = DocumentAnalysis.get_cached_analysis_dict(document_id, language, model)
+        if cached:
+            return jsonify({
+                'analysis': cached,
+                'cached': True
+            }), 200
 
-        # Créer l'entrée d'analyse
-    analysis = DocumentAnalysis.create_analysis(
-        document_id=document_id,
-        user_id=user.id,
-        model_used="tinyllama:1.1b-chat-v0.6-q4_1",
-        language="fr"
+    # Une analyse identique déjà en cours est partagée plutôt que relancée
+    analysis, created = DocumentAnalysis.start_or_join(
+        document_id, user.id, model=model, language=language
     )
-    # Lancer l'analyse
-    try:
-        analysis.status = 'processing'
-        db.session.commit()
-
-        result = requests.post(
-            f"http://service_ia_locale:11434/api/generate",
-            json={
-                "model": "llama3.2",
-                "prompt": f"Analyse le document suivant et fournis un résumé : \n\n{content}",
-                "stream": False,
-                "language": "fr"
-            },
-            timeout=300
-        )
-
-        print(result.text)
-        if result.status_code == 200:
-            analysis.mark_completed(
-                summary=result.json().get('response'),
-                processing_time=result.json().get('eval_duration'),
-                keywords=[],  # Liste vide pour l'instant
-                key_points=[],  # Liste vide pour l'instant
-            )
 
+    # Récupération du contenu + inférence Ollama dans le worker Celery
+    if created:
+        try:
+            run_analysis.delay(analysis.id)
+        except Exception:
+            # Broker injoignable : ne pas laisser une analyse « pending »
+            # orpheline que les demandes suivantes rejoindraient
+            logger.exception("Impossible de planifier l'analyse")
+            analysis.mark_failed('File de traitement indisponible')
             return jsonify({
-                'analysis': analysis.to_dict(),
-                'cached': False
-            }), 200
-        else:
-            analysis.mark_failed('Erreur inconnue')
-            return jsonify({
-                'error': 'Analyse échouée',
-                'message': 'Erreur lors de l\'analyse'
-            }), 500
+                'error': 'Service d\'analyse temporairement indisponible'
+            }), 503
 
-    except Exception as e:
-        logger.error(f"Erreur analyse IA: {e}")
-        analysis.mark_failed(str(e))
-        return jsonify({
-            'error': 'Erreur interne',
-            'message': str(e)
-        }), 500
+    status_url = url_for('ai.get_analysis', analysis_id=analysis.id)
+    return jsonify({
+        'analysis': analysis.to_dict(),
+        'status_url': status_url,
+        'cached': False
+    }), 202, {'Location': status_url}
 
 
 @ai_bp.route('/summary/<int:document_id>', methods=['POST'])
@@ -124,29 +235,27 @@ def generate_summary(document_id):
 
     Body JSON (optionnel):
         language: Langue du document (fr, en) - défaut: fr
+        force_refresh: Ignorer le cache et régénérer (défaut: false)
 
     Returns:
-        200: Résumé généré
+        200: Résumé généré (flux SSE si Accept: text/event-stream)
         403: Accès refusé
         404: Document non trouvé
         503: Service IA indisponible
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-
     # Vérifier l'accès
-    if not check_document_access(user, document_id):
+    user = authorize_document(get_jwt_identity(), document_id)
+    if user is None:
         return jsonify({
             'error': 'Accès refusé',
             'message': 'Vous n\'avez pas accès à ce document'
         }), 403
 
-    data = request.json or {}
+    data = request.get_json(silent=True) or {}
     language = data.get('language', 'fr')
 
-    # Récupérer le contenu
-    mayan = MayanService()
-    content = mayan.get_document_content(document_id, token=user.mayan_token)
+    # Récupérer le contenu (test de connexion IA en parallèle)
+    ai, content, connected = load_content_for_ai(document_id, user.mayan_token)
 
     if not content:
         return jsonify({
@@ -154,19 +263,39 @@ def generate_summary(document_id):
             'message': 'Impossible de récupérer le contenu du document'
         }), 404
 
+    # Résumé déjà généré pour ce contenu
+    key = llm_cache_key('summary', ai.model, language, content)
+    cached = None if data.get('force_refresh') else cache_get(key)
+    if cached is not None:
+        summary = cached.decode()
+        if wants_stream():
+            return sse_response([summary], document_id=document_id, cached=True)
+        return jsonify({
+            'document_id': document_id,
+            'summary': summary,
+            'cached': True
+        }), 200
+
     # Générer le résumé
-    ai = AIService()
-    if not ai.check_connection():
+    if not connected:
         return jsonify({
             'error': 'Service IA indisponible'
         }), 503
 
+    ttl = current_app.config['LLM_SUMMARY_CACHE_TTL']
+    if wants_stream():
+        return sse_response(ai.stream_summary(content, language=language),
+                            on_complete=lambda text: cache_set(key, text, ttl),
+                            document_id=document_id, cached=False)
+
     summary = ai.generate_summary(content, language=language)
 
     if summary:
+        cache_set(key, summary, ttl)
         return jsonify({
             'document_id': document_id,
-            'summary': summary
+            'summary': summary,
+            'cached': False
         }), 200
     else:
         return jsonify({
@@ -183,6 +312,7 @@ def extract_keywords(document_id):
     Body JSON (optionnel):
         language: Langue du document (fr, en) - défaut: fr
         count: Nombre de mots-clés (défaut: 10)
+        force_refresh: Ignorer le cache et régénérer (défaut: false)
 
     Returns:
         200: Mots-clés extraits
@@ -190,41 +320,50 @@ def extract_keywords(document_id):
         404: Document non trouvé
         503: Service IA indisponible
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-
     # Vérifier l'accès
-    if not check_document_access(user, document_id):
+    user = authorize_document(get_jwt_identity(), document_id)
+    if user is None:
         return jsonify({
             'error': 'Accès refusé',
             'message': 'Vous n\'avez pas accès à ce document'
         }), 403
 
-    data = request.json or {}
+    data = request.get_json(silent=True) or {}
     language = data.get('language', 'fr')
     count = data.get('count', 10)
 
-    # Récupérer le contenu
-    mayan = MayanService()
-    content = mayan.get_document_content(document_id, token=user.mayan_token)
+    # Récupérer le contenu (test de connexion IA en parallèle)
+    ai, content, connected = load_content_for_ai(document_id, user.mayan_token)
 
     if not content:
         return jsonify({
             'error': 'Contenu non disponible'
         }), 404
 
+    # Mots-clés déjà extraits pour ce contenu
+    key = llm_cache_key('keywords', ai.model, language, content, count)
+    cached = None if data.get('force_refresh') else cache_get(key)
+    if cached is not None:
+        return jsonify({
+            'document_id': document_id,
+            'keywords': orjson.loads(cached),
+            'cached': True
+        }), 200
+
     # Extraire les mots-clés
-    ai = AIService()
-    if not ai.check_connection():
+    if not connected:
         return jsonify({
             'error': 'Service IA indisponible'
         }), 503
 
     keywords = ai.extract_keywords(content, count=count, language=language)
+    if keywords:
+        cache_set(key, orjson.dumps(keywords), current_app.config['LLM_SUMMARY_CACHE_TTL'])
 
     return jsonify({
         'document_id': document_id,
-        'keywords': keywords
+        'keywords': keywords,
+        'cached': False
     }), 200
 
 
@@ -237,24 +376,23 @@ def ask_question(document_id):
     Body JSON:
         question: La question à poser (requis)
         language: Langue (fr, en) - défaut: fr
+        force_refresh: Ignorer le cache et régénérer (défaut: false)
 
     Returns:
-        200: Réponse à la question
+        200: Réponse à la question (flux SSE si Accept: text/event-stream)
         400: Question manquante
         403: Accès refusé
         404: Document non trouvé
         503: Service IA indisponible
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-
     # Vérifier l'accès
-    if not check_document_access(user, document_id):
+    user = authorize_document(get_jwt_identity(), document_id)
+    if user is None:
         return jsonify({
             'error': 'Accès refusé'
         }), 403
 
-    data = request.json or {}
+    data = request.get_json(silent=True) or {}
     question = data.get('question', '').strip()
     language = data.get('language', 'fr')
 
@@ -263,29 +401,51 @@ def ask_question(document_id):
             'error': 'La question est requise'
         }), 400
 
-    # Récupérer le contenu
-    mayan = MayanService()
-    content = mayan.get_document_content(document_id, token=user.mayan_token)
+    # Récupérer le contenu (test de connexion IA en parallèle)
+    ai, content, connected = load_content_for_ai(document_id, user.mayan_token)
 
     if not content:
         return jsonify({
             'error': 'Contenu non disponible'
         }), 404
 
+    # Même question déjà posée sur ce contenu (casse et espaces ignorés)
+    normalized = ' '.join(question.lower().split())
+    key = llm_cache_key('answer', ai.model, language, content, normalized)
+    cached = None if data.get('force_refresh') else cache_get(key)
+    if cached is not None:
+        answer = cached.decode()
+        if wants_stream():
+            return sse_response([answer], document_id=document_id,
+                                question=question, cached=True)
+        return jsonify({
+            'document_id': document_id,
+            'question': question,
+            'answer': answer,
+            'cached': True
+        }), 200
+
     # Poser la question
-    ai = AIService()
-    if not ai.check_connection():
+    if not connected:
         return jsonify({
             'error': 'Service IA indisponible'
         }), 503
 
+    ttl = current_app.config['LLM_ANSWER_CACHE_TTL']
+    if wants_stream():
+        return sse_response(ai.stream_answer(content, question, language=language),
+                            on_complete=lambda text: cache_set(key, text, ttl),
+                            document_id=document_id, question=question, cached=False)
+
     answer = ai.ask_question(content, question, language=language)
 
     if answer:
+        cache_set(key, answer, ttl)
         return jsonify({
             'document_id': document_id,
             'question': question,
-            'answer': answer
+            'answer': answer,
+            'cached': False
         }), 200
     else:
         return jsonify({
@@ -302,6 +462,8 @@ def get_analysis_history():
     Query params:
         page: Numéro de page
         per_page: Éléments par page
+        cursor: Curseur de la page suivante (next_cursor), remplace page
+        exact_total: false pour omettre total/pages (pas de COUNT)
         document_id: Filtrer par document
         status: Filtrer par statut (pending, processing, completed, failed)
 
@@ -310,8 +472,7 @@ def get_analysis_history():
     """
     user_id = get_jwt_identity()
 
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    page, per_page = page_args()
     document_id = request.args.get('document_id', type=int)
     status = request.args.get('status')
 
@@ -323,16 +484,16 @@ def get_analysis_history():
     if status:
         query = query.filter_by(status=status)
 
-    pagination = query.order_by(DocumentAnalysis.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        items, meta = paginate(query, DocumentAnalysis, page, per_page,
+                               cursor=request.args.get('cursor'),
+                               exact_total=request.args.get('exact_total', 'true').lower() != 'false')
+    except ValueError:
+        return jsonify({'error': 'Curseur invalide'}), 400
 
     return jsonify({
-        'analyses': [a.to_dict() for a in pagination.items],
-        'total': pagination.total,
-        'page': page,
-        'per_page': per_page,
-        'pages': pagination.pages
+        'analyses': analysis_list_dump.dump(items),
+        **meta
     }), 200
 
 
@@ -341,6 +502,8 @@ def get_analysis_history():
 def get_analysis(analysis_id):
     """
     Récupère une analyse spécifique.
+    Outre son auteur, tout utilisateur ayant accès au document peut la
+    consulter (analyses partagées entre demandes identiques).
 
     Returns:
         200: Détails de l'analyse
@@ -348,12 +511,10 @@ def get_analysis(analysis_id):
     """
     user_id = get_jwt_identity()
 
-    analysis = DocumentAnalysis.query.filter_by(
-        id=analysis_id,
-        user_id=user_id
-    ).first()
+    analysis = db.session.get(DocumentAnalysis, analysis_id)
 
-    if not analysis:
+    if not analysis or (analysis.user_id != user_id and
+                        authorize_document(user_id, analysis.document_id) is None):
         return jsonify({'error': 'Analyse non trouvée'}), 404
 
     return jsonify({'analysis': analysis.to_dict()}), 200
@@ -363,16 +524,21 @@ def get_analysis(analysis_id):
 
 @ai_bp.route('/status', methods=['GET'])
 @jwt_required()
+@cache_endpoint('short')
 def ai_status():
     """
     Vérifie le statut du service IA.
 
+    Query params:
+        force: 1 pour interroger Ollama sans passer par les caches
+
     Returns:
         200: Statut du service
     """
-    ai = AIService()
-    connected = ai.check_connection()
-    models = ai.list_models() if connected else []
+    ai = shared_ai_service()
+    force = request.args.get('force', '').lower() in ('1', 'true')
+    connected = ai.check_connection(force=force)
+    models = ai.list_models(force=force) if connected else []
 
     return jsonify({
         'status': 'available' if connected else 'unavailable',
@@ -383,6 +549,7 @@ def ai_status():
 
 @ai_bp.route('/models', methods=['GET'])
 @jwt_required()
+@cache_endpoint('normal')
 def list_models():
     """
     Liste les modèles IA disponibles.
@@ -391,7 +558,7 @@ def list_models():
         200: Liste des modèles
         503: Service indisponible
     """
-    ai = AIService()
+    ai = shared_ai_service()
     if not ai.check_connection():
         return jsonify({
             'error': 'Service IA indisponible'
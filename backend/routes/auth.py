@@ -5,12 +5,14 @@ Gestion: inscription, connexion, déconnexion, refresh token
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import (
     create_access_token, create_refresh_token, 
-    jwt_required, get_jwt_identity, get_jwt
+    jwt_required, get_jwt
 )
 from marshmallow import Schema, fields, validate, ValidationError
+from sqlalchemy.exc import IntegrityError
 from models import db
-from models.user import User
-from services.mayan_service import MayanService
+from models.user import User, CONFLICT_MESSAGES
+from tasks.mayan_sync import enqueue, sync_mayan_user, fetch_mayan_token
+from utils.roles import get_current_user
 from datetime import datetime
 import logging
 
@@ -36,6 +38,11 @@ class LoginSchema(Schema):
     password = fields.String(required=True)
 
 
+# Instances partagées (les schémas marshmallow sont sans état)
+register_schema = RegisterSchema()
+login_schema = LoginSchema()
+
+
 # =========== Routes ===========
 
 @auth_bp.route('/register', methods=['POST'])
@@ -58,16 +65,14 @@ def register():
     """
     # Valider les données
     try:
-        data = RegisterSchema().load(request.json)
+        data = register_schema.load(request.json)
     except ValidationError as e:
         return jsonify({'error': 'Données invalides', 'details': e.messages}), 400
     
-    # Vérifier si l'utilisateur existe déjà
-    if User.query.filter_by(username=data['username']).first():
-        return jsonify({'error': 'Ce nom d\'utilisateur est déjà utilisé'}), 409
-    
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({'error': 'Cet email est déjà utilisé'}), 409
+    # Vérifier si l'utilisateur existe déjà (une seule requête)
+    conflict = User.find_conflict(data['username'], data['email'])
+    if conflict:
+        return jsonify({'error': CONFLICT_MESSAGES[conflict]}), 409
     
     try:
         # Créer l'utilisateur dans notre base
@@ -79,27 +84,22 @@ def register():
             last_name=data.get('last_name', '')
         )
         
-        # Créer l'utilisateur dans Mayan EDMS (pour SSO)
-        try:
-            mayan = MayanService()
-            mayan_user = mayan.create_mayan_user(
-                username=data['username'],
-                email=data['email'],
-                password=data['password'],
-                first_name=data.get('first_name', ''),
-                last_name=data.get('last_name', '')
-            )
-            
-            if mayan_user:
-                user.mayan_user_id = mayan_user.get('id')
-                db.session.commit()
-                logger.info(f"Utilisateur Mayan créé: {mayan_user.get('id')}")
-        except Exception as e:
-            logger.warning(f"Impossible de créer l'utilisateur Mayan: {e}")
-            # Continue même si Mayan échoue
+        # Créer l'utilisateur dans Mayan EDMS (pour SSO), en arrière-plan :
+        # l'inscription n'attend pas Mayan et réussit même s'il échoue
+        enqueue(
+            sync_mayan_user,
+            user.id,
+            data['username'],
+            data['email'],
+            data['password'],
+            data.get('first_name', ''),
+            data.get('last_name', '')
+        )
         
         # Générer les tokens
-        access_token = create_access_token(identity=user.id)
+        access_token = create_access_token(
+            identity=user.id, additional_claims=user.token_claims()
+        )
         refresh_token = create_refresh_token(identity=user.id)
         
         return jsonify({
@@ -109,9 +109,13 @@ def register():
             'refresh_token': refresh_token
         }), 201
         
-    except Exception as e:
+    except IntegrityError:
+        # Inscription concurrente avec le même username/email
         db.session.rollback()
-        logger.error(f"Erreur inscription: {e}")
+        return jsonify({'error': 'Nom d\'utilisateur ou email déjà utilisé'}), 409
+    except Exception:
+        db.session.rollback()
+        logger.exception("Erreur inscription")
         return jsonify({'error': 'Erreur lors de l\'inscription'}), 500
 
 
@@ -130,14 +134,12 @@ def login():
         403: Compte désactivé
     """
     try:
-        data = LoginSchema().load(request.json)
+        data = login_schema.load(request.json)
     except ValidationError as e:
         return jsonify({'error': 'Données invalides', 'details': e.messages}), 400
     
     # Chercher l'utilisateur par username ou email
-    user = User.query.filter(
-        (User.username == data['username']) | (User.email == data['username'])
-    ).first()
+    user = User.find_by_login(data['username'])
     
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Identifiants invalides'}), 401
@@ -145,21 +147,28 @@ def login():
     if not user.is_active:
         return jsonify({'error': 'Ce compte a été désactivé'}), 403
     
-    # Mettre à jour la dernière connexion
-    user.update_last_login()
+    # Mettre à jour la dernière connexion ; le hash est recalculé au coût
+    # configuré si BCRYPT_ROUNDS a changé depuis sa création
+    user.update_last_login(commit=False)
+    if user.needs_rehash():
+        user.set_password(data['password'])
+    db.session.commit()
     
-    # Obtenir le token Mayan pour SSO
-    try:
-        mayan = MayanService()
-        mayan_token = mayan.authenticate_user(data['username'], data['password'])
-        if mayan_token:
-            user.mayan_token = mayan_token
-            db.session.commit()
-    except Exception as e:
-        logger.warning(f"Impossible d'obtenir le token Mayan: {e}")
+    # SSO Mayan en arrière-plan : créer le compte Mayan s'il manque (échec
+    # à l'inscription), sinon renouveler le token. Tant que le token n'est
+    # pas enregistré (première connexion, ou après une déconnexion qui l'a
+    # effacé), la réponse l'indique par mayan_token_pending et le client
+    # l'obtient via GET /api/auth/mayan-token
+    if user.mayan_user_id is None:
+        enqueue(sync_mayan_user, user.id, user.username, user.email, data['password'],
+                user.first_name or '', user.last_name or '')
+    else:
+        enqueue(fetch_mayan_token, user.id, user.username, data['password'])
     
     # Générer les tokens
-    access_token = create_access_token(identity=user.id)
+    access_token = create_access_token(
+        identity=user.id, additional_claims=user.token_claims()
+    )
     refresh_token = create_refresh_token(identity=user.id)
     
     return jsonify({
@@ -167,7 +176,8 @@ def login():
         'user': user.to_dict(),
         'access_token': access_token,
         'refresh_token': refresh_token,
-        'mayan_token': user.mayan_token
+        'mayan_token': user.mayan_token,
+        'mayan_token_pending': user.mayan_token is None
     }), 200
 
 
@@ -184,8 +194,7 @@ def logout():
     # Dans une implémentation complète, on ajouterait le token à une blacklist
     # Pour simplifier, le client doit simplement supprimer ses tokens
     
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user()
     
     if user:
         # Supprimer le token Mayan
@@ -207,13 +216,14 @@ def refresh():
     Returns:
         200: Nouveau token d'accès
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user()
     
     if not user or not user.is_active:
         return jsonify({'error': 'Utilisateur invalide'}), 401
     
-    access_token = create_access_token(identity=user_id)
+    access_token = create_access_token(
+        identity=user.id, additional_claims=user.token_claims()
+    )
     
     return jsonify({
         'access_token': access_token
@@ -230,8 +240,7 @@ def me():
         200: Informations utilisateur
         404: Utilisateur non trouvé
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user()
     
     if not user:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
@@ -264,8 +273,7 @@ def change_password():
     if len(data['new_password']) < 6:
         return jsonify({'error': 'Le nouveau mot de passe doit faire au moins 6 caractères'}), 400
     
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user()
     
     if not user.check_password(data['current_password']):
         return jsonify({'error': 'Mot de passe actuel incorrect'}), 401
@@ -287,17 +295,16 @@ def get_mayan_token():
         200: Token Mayan
         404: Token non disponible
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user()
     
     if not user:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
     
     if not user.mayan_token:
-        # Essayer de régénérer le token
+        # Token en cours d'obtention après la connexion (tâche en arrière-plan)
         return jsonify({
             'error': 'Token Mayan non disponible',
-            'message': 'Reconnectez-vous pour obtenir un nouveau token'
+            'message': 'Token en cours d\'obtention, réessayez dans quelques secondes'
         }), 404
     
     return jsonify({
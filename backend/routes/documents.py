@@ -2,53 +2,163 @@
 Routes pour les documents
 Proxy vers Mayan EDMS avec vérification des accès temporaires
 """
-from flask import Blueprint, request, jsonify, Response
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, Response, current_app, g, stream_with_context
+from flask_jwt_extended import jwt_required
+from models import db
 from models.user import User
 from models.temporary_access import TemporaryAccess
-from services.mayan_service import MayanService
+from services import shared_mayan_service
+from services.mayan_service import BoundMayanService
+from utils.roles import get_current_user_lite
+from utils.pagination import page_args
+from utils.cache import cache_get, cache_set
 from datetime import datetime
+from typing import Optional, FrozenSet, Iterator, Tuple
+from urllib.parse import quote
+import hashlib
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
 documents_bp = Blueprint('documents', __name__, url_prefix='/api/documents')
 
 
-def get_mayan_service(user: User = None) -> MayanService:
-    """Crée un service Mayan avec le token utilisateur si disponible"""
-    service = MayanService()
-    return service
+def mayan_client(user: User) -> BoundMayanService:
+    """Service Mayan partagé, lié au token Mayan de l'utilisateur"""
+    return shared_mayan_service().bound(user.mayan_token)
 
 
-def check_user_access(user: User, document_id: int = None) -> tuple:
+def user_allowed_docs(user_id: int) -> Tuple[FrozenSet[int], bool]:
     """
-    Vérifie si l'utilisateur a accès aux documents.
+    (IDs des documents autorisés, accès global) de l'utilisateur,
+    lus une seule fois par requête (flask.g)
+    """
+    allowed = g.get('_allowed_docs')
+    if allowed is None:
+        allowed = TemporaryAccess.get_allowed_doc_ids(user_id)
+        g._allowed_docs = allowed
+    return allowed
+
+
+def assert_list_access(user: User) -> Optional[tuple]:
+    """
+    Vérifie que l'utilisateur peut lister les documents
+    (admin ou au moins un accès temporaire valide).
 
     Returns:
-        (has_access: bool, error_response: Response or None)
+        None si autorisé, sinon la réponse d'erreur (json, 403)
     """
     if user.is_admin():
-        return True, None
-
-    # Si un document spécifique, vérifier l'accès
-    if document_id:
-        has_access = TemporaryAccess.check_document_access(user.id, document_id)
-        if not has_access:
-            return False, (jsonify({
-                'error': 'Accès refusé',
-                'message': 'Vous n\'avez pas accès à ce document'
-            }), 403)
-    else:
-        # Pour la liste, vérifier s'il a au moins un accès valide
-        accesses = TemporaryAccess.get_user_valid_accesses(user.id)
-        if not accesses:
-            return False, (jsonify({
-                'error': 'Accès refusé',
-                'message': 'Aucun accès temporaire actif'
-            }), 403)
+        return None
+    doc_ids, has_global = user_allowed_docs(user.id)
+    if doc_ids or has_global:
+        return None
+    return jsonify({
+        'error': 'Accès refusé',
+        'message': 'Aucun accès temporaire actif'
+    }), 403
+
+
+def assert_doc_access(user: User, document_id: int) -> Optional[tuple]:
+    """
+    Vérifie que l'utilisateur a accès à un document précis.
+
+    Returns:
+        None si autorisé, sinon la réponse d'erreur (json, 403)
+    """
+    if user.is_admin() or TemporaryAccess.check_document_access(user.id, document_id):
+        return None
+    return jsonify({
+        'error': 'Accès refusé',
+        'message': 'Vous n\'avez pas accès à ce document'
+    }), 403
+
+
+def allowed_document_ids(user: User) -> Optional[FrozenSet[int]]:
+    """
+    IDs des documents visibles par l'utilisateur, à transmettre à Mayan
+    comme filtre (id__in) pour que la pagination porte sur ces seuls documents.
+
+    Returns:
+        None si l'utilisateur voit tout (admin ou accès global)
+    """
+    return TemporaryAccess.allowed_document_ids(user, loader=user_allowed_docs)
+
+
+def restrict_to_allowed(mayan_response: dict,
+                        allowed_ids: Optional[FrozenSet[int]]) -> Tuple[list, int]:
+    """
+    (résultats, total) d'une page Mayan, limités aux documents autorisés.
+    Le filtre id__in est aussi appliqué par Mayan ; ce second filtre
+    (fail-closed) garantit qu'aucun document interdit n'est renvoyé si
+    Mayan l'ignore. Dans ce cas, le total est borné par le nombre d'IDs
+    autorisés.
+    """
+    results = mayan_response.get('results', [])
+    total = mayan_response.get('count', 0)
+    if allowed_ids is None:
+        return results, total
+
+    allowed = [doc for doc in results if doc.get('id') in allowed_ids]
+    if len(allowed) != len(results):
+        logger.warning("Filtre id__in ignoré par Mayan : documents non autorisés écartés")
+        total = min(total, len(allowed_ids))
+    return allowed, total
+
+
+def _content_envelope(document_id: int, chunks) -> Iterator[bytes]:
+    """Sérialise {document_id, content} morceau par morceau"""
+    yield b'{"document_id":%d,"content":"' % document_id
+    for chunk in chunks:
+        # Chaîne JSON échappée par orjson, sans ses guillemets
+        yield orjson.dumps(chunk)[1:-1]
+    yield b'"}'
 
-    return True, None
+
+def _attachment_disposition(filename: str) -> str:
+    """
+    En-tête Content-Disposition d'un téléchargement. Les noms non ASCII
+    ou contenant des caractères spéciaux sont transmis en filename*
+    (RFC 5987, entièrement encodé), avec un repli ASCII sans guillemets,
+    barres obliques inverses ni caractères de contrôle.
+    """
+    fallback = ''.join(
+        c for c in filename if ' ' <= c < '\x7f' and c not in '"\\'
+    ).strip() or 'document'
+    if fallback == filename:
+        return f'attachment; filename="{fallback}"'
+    return f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename, safe="")}'
+
+
+def _etag_key(kind: str, document_id: int) -> str:
+    return f"etag:{kind}:{document_id}"
+
+
+def _not_modified(kind: str, document_id: int) -> Optional[Response]:
+    """
+    Réponse 304 si le client possède déjà la dernière version connue
+    (ETag en cache), sans appel à Mayan. À appeler après la vérification
+    d'accès.
+    """
+    if not request.if_none_match:
+        return None
+    etag = cache_get(_etag_key(kind, document_id))
+    if etag is None or not request.if_none_match.contains(etag.decode()):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag.decode())
+    return response
+
+
+def _with_etag(kind: str, document_id: int, payload: dict) -> Response:
+    """Réponse JSON avec un ETag (empreinte du corps), mémorisé DOCUMENT_ETAG_TTL secondes"""
+    response = jsonify(payload)
+    etag = hashlib.blake2b(response.get_data(), digest_size=16).hexdigest()
+    response.set_etag(etag)
+    cache_set(_etag_key(kind, document_id), etag,
+              current_app.config.get('DOCUMENT_ETAG_TTL', 60))
+    return response.make_conditional(request)
 
 
 # =========== Routes ===========
@@ -67,50 +177,26 @@ def list_documents():
         200: Liste des documents
         403: Accès refusé
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user_lite()
 
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
+    page, per_page = page_args()
 
     # Vérifier l'accès
-    has_access, error = check_user_access(user)
-    if not has_access:
-        if isinstance(error, tuple):
-            return error[0], error[1]
+    error = assert_list_access(user)
+    if error:
         return error
 
-    mayan = get_mayan_service(user)
-    token = user.mayan_token
-
-    mayan_response = mayan.get_documents(token=token, page=page, page_size=per_page)
-
-    # Pour les non-admins, filtrer selon les accès
-    if not user.is_admin():
-        accesses = TemporaryAccess.get_user_valid_accesses(user.id)
-        allowed_doc_ids = set()
-        has_global_access = False
+    mayan = mayan_client(user)
 
-        for access in accesses:
-            if access.document_id is None:
-                has_global_access = True
-                break
-            allowed_doc_ids.add(access.document_id)
-
-        if not has_global_access:
-            # Filtrer les documents
-            filtered_results = [
-                doc for doc in mayan_response.get('results', [])
-                if doc.get('id') in allowed_doc_ids
-            ]
-            mayan_response['results'] = filtered_results
-            mayan_response['count'] = len(filtered_results)
+    allowed_ids = allowed_document_ids(user)
+    mayan_response = mayan.get_documents(
+        page=page, page_size=per_page, id_in=allowed_ids
+    )
 
     # Normaliser la réponse pour le frontend
     # Mayan retourne: {count, results, next, previous}
     # Frontend attend: {documents, total, pages, page, per_page}
-    total = mayan_response.get('count', 0)
-    results = mayan_response.get('results', [])
+    results, total = restrict_to_allowed(mayan_response, allowed_ids)
 
     # Calculer le nombre de pages
     pages = (total + per_page - 1) // per_page if per_page > 0 else 1
@@ -134,30 +220,31 @@ def get_document(document_id):
 
     Returns:
         200: Détails du document
+        304: Non modifié (If-None-Match)
         403: Accès refusé
         404: Document non trouvé
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user_lite()
 
     # Vérifier l'accès
-    has_access, error = check_user_access(user, document_id)
-    if not has_access:
-        if isinstance(error, tuple):
-            return error[0], error[1]
+    error = assert_doc_access(user, document_id)
+    if error:
         return error
 
-    mayan = get_mayan_service(user)
-    token = user.mayan_token
+    not_modified = _not_modified('doc', document_id)
+    if not_modified:
+        return not_modified
+
+    mayan = mayan_client(user)
 
-    document = mayan.get_document(document_id, token=token)
+    document = mayan.get_document(document_id)
 
     if not document:
         return jsonify({'error': 'Document non trouvé'}), 404
 
     # Normaliser la réponse pour le frontend
     # Frontend attend: {document: {...}}
-    return jsonify({'document': document}), 200
+    return _with_etag('doc', document_id, {'document': document})
 
 
 @documents_bp.route('/<int:document_id>/content', methods=['GET'])
@@ -171,31 +258,31 @@ def get_document_content(document_id):
         403: Accès refusé
         404: Document ou contenu non trouvé
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user_lite()
 
     # Vérifier l'accès
-    has_access, error = check_user_access(user, document_id)
-    if not has_access:
-        if isinstance(error, tuple):
-            return error[0], error[1]
+    error = assert_doc_access(user, document_id)
+    if error:
         return error
 
-    mayan = get_mayan_service(user)
-    token = user.mayan_token
+    mayan = mayan_client(user)
 
-    content = mayan.get_document_content(document_id, token=token)
+    chunks = mayan.iter_document_content(document_id)
 
-    if content is None:
+    if chunks is None:
         return jsonify({
             'error': 'Contenu non disponible',
             'message': 'Le document n\'a pas encore été traité par OCR'
         }), 404
 
-    return jsonify({
-        'document_id': document_id,
-        'content': content
-    }), 200
+    # Enveloppe JSON émise au fil des pages, sans assembler le texte ; la
+    # connexion PostgreSQL est rendue au pool pendant les appels OCR
+    db.session.commit()
+    return Response(
+        stream_with_context(_content_envelope(document_id, chunks)),
+        status=200,
+        mimetype='application/json'
+    )
 
 
 @documents_bp.route('/search', methods=['GET'])
@@ -214,51 +301,28 @@ def search_documents():
         400: Termes de recherche manquants
         403: Accès refusé
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user_lite()
 
     query = request.args.get('q', '').strip()
     if not query:
         return jsonify({'error': 'Paramètre q requis'}), 400
 
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
+    page, per_page = page_args()
 
     # Vérifier l'accès
-    has_access, error = check_user_access(user)
-    if not has_access:
-        if isinstance(error, tuple):
-            return error[0], error[1]
+    error = assert_list_access(user)
+    if error:
         return error
 
-    mayan = get_mayan_service(user)
-    token = user.mayan_token
-
-    mayan_results = mayan.search_documents(query, token=token, page=page, page_size=per_page)
+    mayan = mayan_client(user)
 
-    # Filtrer selon les accès pour les non-admins
-    if not user.is_admin():
-        accesses = TemporaryAccess.get_user_valid_accesses(user.id)
-        allowed_doc_ids = set()
-        has_global_access = False
-
-        for access in accesses:
-            if access.document_id is None:
-                has_global_access = True
-                break
-            allowed_doc_ids.add(access.document_id)
-
-        if not has_global_access:
-            filtered_results = [
-                doc for doc in mayan_results.get('results', [])
-                if doc.get('id') in allowed_doc_ids
-            ]
-            mayan_results['results'] = filtered_results
-            mayan_results['count'] = len(filtered_results)
+    allowed_ids = allowed_document_ids(user)
+    mayan_results = mayan.search_documents(
+        query, page=page, page_size=per_page, id_in=allowed_ids
+    )
 
     # Normaliser la réponse pour le frontend
-    total = mayan_results.get('count', 0)
-    results = mayan_results.get('results', [])
+    results, total = restrict_to_allowed(mayan_results, allowed_ids)
     pages = (total + per_page - 1) // per_page if per_page > 0 else 1
 
     return jsonify({
@@ -281,31 +345,32 @@ def download_document(document_id):
         403: Accès refusé
         404: Document non trouvé
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user_lite()
     
     # Vérifier l'accès
-    has_access, error = check_user_access(user, document_id)
-    if not has_access:
+    error = assert_doc_access(user, document_id)
+    if error:
         return error
     
-    mayan = get_mayan_service(user)
-    token = user.mayan_token
+    mayan = mayan_client(user)
     
-    result = mayan.download_document(document_id, token=token)
+    result = mayan.download_document(document_id)
     
     if not result:
         return jsonify({'error': 'Document non trouvé ou téléchargement impossible'}), 404
     
-    file_data, filename, content_type = result
+    chunks, filename, content_type, content_length = result
+    
+    # Fichier relayé bloc par bloc depuis Mayan, sans le charger en mémoire
+    headers = {'Content-Disposition': _attachment_disposition(filename)}
+    if content_length:
+        headers['Content-Length'] = content_length
     
     return Response(
-        file_data,
+        chunks,
         mimetype=content_type,
-        headers={
-            'Content-Disposition': f'attachment; filename="{filename}"',
-            'Content-Length': str(len(file_data))
-        }
+        headers=headers,
+        direct_passthrough=True
     )
 
 
@@ -317,24 +382,25 @@ def get_document_tags(document_id):
 
     Returns:
         200: Liste des tags
+        304: Non modifié (If-None-Match)
         403: Accès refusé
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user_lite()
 
     # Vérifier l'accès
-    has_access, error = check_user_access(user, document_id)
-    if not has_access:
-        if isinstance(error, tuple):
-            return error[0], error[1]
+    error = assert_doc_access(user, document_id)
+    if error:
         return error
 
-    mayan = get_mayan_service(user)
-    token = user.mayan_token
+    not_modified = _not_modified('tags', document_id)
+    if not_modified:
+        return not_modified
 
-    tags = mayan.get_document_tags(document_id, token=token)
+    mayan = mayan_client(user)
 
-    return jsonify({'tags': tags}), 200
+    tags = mayan.get_document_tags(document_id)
+
+    return _with_etag('tags', document_id, {'tags': tags})
 
 
 # =========== Routes Cabinets ===========
@@ -349,20 +415,16 @@ def list_cabinets():
         200: Liste des cabinets
         403: Accès refusé
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user_lite()
 
     # Vérifier l'accès
-    has_access, error = check_user_access(user)
-    if not has_access:
-        if isinstance(error, tuple):
-            return error[0], error[1]
+    error = assert_list_access(user)
+    if error:
         return error
 
-    mayan = get_mayan_service(user)
-    token = user.mayan_token
+    mayan = mayan_client(user)
 
-    cabinets = mayan.get_cabinets(token=token)
+    cabinets = mayan.get_cabinets()
 
     return jsonify({'cabinets': cabinets}), 200
 
@@ -377,20 +439,16 @@ def get_cabinet_documents(cabinet_id):
         200: Liste des documents
         403: Accès refusé
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user_lite()
 
     # Vérifier l'accès (TODO: vérifier l'accès au cabinet)
-    has_access, error = check_user_access(user)
-    if not has_access:
-        if isinstance(error, tuple):
-            return error[0], error[1]
+    error = assert_list_access(user)
+    if error:
         return error
 
-    mayan = get_mayan_service(user)
-    token = user.mayan_token
+    mayan = mayan_client(user)
 
-    documents = mayan.get_cabinet_documents(cabinet_id, token=token)
+    documents = mayan.get_cabinet_documents(cabinet_id)
 
     return jsonify({'documents': documents}), 200
 
@@ -406,13 +464,11 @@ def list_document_types():
     Returns:
         200: Liste des types
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user_lite()
 
-    mayan = get_mayan_service(user)
-    token = user.mayan_token
+    mayan = mayan_client(user)
 
-    types = mayan.get_document_types(token=token)
+    types = mayan.get_document_types()
 
     return jsonify({'document_types': types}), 200
 
@@ -432,11 +488,13 @@ def upload_document():
 
     Returns:
         201: Document créé
+        202: Upload accepté, document en cours de création par Mayan
+             (pas encore d'ID)
         400: Fichier manquant
         403: Accès refusé
+        413: Fichier trop volumineux (MAX_CONTENT_LENGTH)
     """
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = get_current_user_lite()
 
 
     if 'file' not in request.files:
@@ -448,16 +506,20 @@ def upload_document():
 
     document_type_id = request.form.get('document_type_id', 1, type=int)
 
-    mayan = get_mayan_service(user)
-    token = user.mayan_token
+    mayan = mayan_client(user)
 
     result = mayan.upload_document(
-        file_data=file.read(),
+        file_stream=file.stream,
         filename=file.filename,
         document_type_id=document_type_id,
-        token=token
+        content_type=file.mimetype
     )
 
+    if result and result.get('pending'):
+        return jsonify({
+            'message': 'Document en cours de traitement',
+            'document': result
+        }), 202
     if result:
         return jsonify({
             'message': 'Document uploadé',
@@ -2,14 +2,50 @@
 Routes de santé et diagnostic
 Pour le monitoring et le debugging
 """
-from flask import Blueprint, jsonify, current_app
-from services.mayan_service import MayanService
-from services.ai_service import AIService
+from flask import Blueprint, Response, request, current_app
+from services import shared_mayan_service, shared_ai_service
 from models import db
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 import logging
+import time
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Délai maximal accordé à chaque sonde du health check détaillé (secondes)
+PROBE_TIMEOUT = 3
+
+_probe_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix='health')
+
+# Durée pendant laquelle le résultat du health check détaillé est réutilisé
+# (une rafale de sondes partage un seul aller-retour vers les services)
+DETAILED_TTL = 2
+
+# Corps statiques sérialisés une seule fois à l'import
+_HEALTH_BODY = orjson.dumps({
+    'status': 'healthy',
+    'service': 'nerostack-backend'
+})
+_INFO_BODY = orjson.dumps({
+    'name': 'NeroStack Backend API',
+    'version': '1.0.0',
+    'description': 'Backend pour la gestion documentaire avec Mayan EDMS et IA locale',
+    'endpoints': {
+        'auth': '/api/auth',
+        'users': '/api/users',
+        'documents': '/api/documents',
+        'access': '/api/access',
+        'ai': '/api/ai',
+        'health': '/api/health'
+    },
+    'documentation': '/api/docs'
+})
+
+
+def _json_response(body: bytes, status: int = 200) -> Response:
+    """Réponse JSON à partir d'un corps déjà sérialisé"""
+    return Response(body, status=status, mimetype='application/json')
+
 health_bp = Blueprint('health', __name__, url_prefix='/api')
 
 
@@ -22,10 +58,43 @@ def health():
     Returns:
         200: Service en ligne
     """
-    return jsonify({
-        'status': 'healthy',
-        'service': 'nerostack-backend'
-    }), 200
+    return _json_response(_HEALTH_BODY)
+
+
+def _check_database() -> dict:
+    """Vérifie la base de données"""
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        return {'status': 'healthy'}
+    except Exception as e:
+        return {'status': 'unhealthy', 'error': str(e)}
+
+
+def _check_mayan() -> dict:
+    """Vérifie Mayan"""
+    try:
+        mayan = shared_mayan_service()
+        if mayan.check_connection():
+            return {'status': 'healthy', 'url': mayan.base_url}
+        return {'status': 'unhealthy', 'error': 'Connection failed'}
+    except Exception as e:
+        return {'status': 'unhealthy', 'error': str(e)}
+
+
+def _check_ai() -> dict:
+    """Vérifie le service IA"""
+    try:
+        ai = shared_ai_service()
+        if ai.check_connection():
+            return {
+                'status': 'healthy',
+                'url': ai.base_url,
+                'model': ai.model,
+                'available_models': ai.list_models()
+            }
+        return {'status': 'unhealthy', 'error': 'Connection failed'}
+    except Exception as e:
+        return {'status': 'unhealthy', 'error': str(e)}
 
 
 @health_bp.route('/health/detailed', methods=['GET'])
@@ -34,61 +103,46 @@ def health_detailed():
     Point de santé détaillé.
     Vérifie tous les services connectés.
     
+    Résultat réutilisé DETAILED_TTL secondes ; `?force=1` relance les sondes.
+
     Returns:
         200: Statut détaillé de tous les services
+        503: Au moins un service dégradé
     """
+    app = current_app._get_current_object()
+
+    cached = app.extensions.get('health_detailed')
+    force = request.args.get('force', '').lower() in ('1', 'true')
+    if cached and not force and time.monotonic() < cached['until']:
+        return _json_response(cached['body'], cached['status'])
+
+    def run(probe):
+        with app.app_context():
+            return probe()
+
+    # Sondes indépendantes : exécutées en parallèle, chacune bornée
+    futures = {
+        name: _probe_pool.submit(run, probe)
+        for name, probe in (
+            ('database', _check_database),
+            ('mayan', _check_mayan),
+            ('ai', _check_ai)
+        )
+    }
+
     status = {
         'backend': {
             'status': 'healthy',
             'version': '1.0.0'
-        },
-        'database': {
-            'status': 'unknown'
-        },
-        'mayan': {
-            'status': 'unknown'
-        },
-        'ai': {
-            'status': 'unknown'
         }
     }
-    
-    # Vérifier la base de données
-    try:
-        db.session.execute(db.text('SELECT 1'))
-        status['database']['status'] = 'healthy'
-    except Exception as e:
-        status['database']['status'] = 'unhealthy'
-        status['database']['error'] = str(e)
-    
-    # Vérifier Mayan
-    try:
-        mayan = MayanService()
-        if mayan.check_connection():
-            status['mayan']['status'] = 'healthy'
-            status['mayan']['url'] = mayan.base_url
-        else:
-            status['mayan']['status'] = 'unhealthy'
-            status['mayan']['error'] = 'Connection failed'
-    except Exception as e:
-        status['mayan']['status'] = 'unhealthy'
-        status['mayan']['error'] = str(e)
-    
-    # Vérifier le service IA
-    try:
-        ai = AIService()
-        if ai.check_connection():
-            status['ai']['status'] = 'healthy'
-            status['ai']['url'] = ai.base_url
-            status['ai']['model'] = ai.model
-            status['ai']['available_models'] = ai.list_models()
-        else:
-            status['ai']['status'] = 'unhealthy'
-            status['ai']['error'] = 'Connection failed'
-    except Exception as e:
-        status['ai']['status'] = 'unhealthy'
-        status['ai']['error'] = str(e)
-    
+    deadline = time.monotonic() + PROBE_TIMEOUT
+    for name, future in futures.items():
+        try:
+            status[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FuturesTimeout:
+            status[name] = {'status': 'unhealthy', 'error': 'Timeout'}
+
     # Déterminer le statut global
     all_healthy = all(
         s.get('status') == 'healthy' 
@@ -98,10 +152,17 @@ def health_detailed():
     
     overall_status = 'healthy' if all_healthy else 'degraded'
     
-    return jsonify({
+    body = orjson.dumps({
         'status': overall_status,
         'services': status
-    }), 200 if all_healthy else 503
+    })
+    code = 200 if all_healthy else 503
+    app.extensions['health_detailed'] = {
+        'body': body,
+        'status': code,
+        'until': time.monotonic() + DETAILED_TTL
+    }
+    return _json_response(body, code)
 
 
 @health_bp.route('/info', methods=['GET'])
@@ -112,20 +173,7 @@ def info():
     Returns:
         200: Informations de l'API
     """
-    return jsonify({
-        'name': 'NeroStack Backend API',
-        'version': '1.0.0',
-        'description': 'Backend pour la gestion documentaire avec Mayan EDMS et IA locale',
-        'endpoints': {
-            'auth': '/api/auth',
-            'users': '/api/users',
-            'documents': '/api/documents',
-            'access': '/api/access',
-            'ai': '/api/ai',
-            'health': '/api/health'
-        },
-        'documentation': '/api/docs'
-    }), 200
+    return _json_response(_INFO_BODY)
 
 
 @health_bp.route('/config', methods=['GET'])
@@ -137,11 +185,16 @@ def config_info():
     Returns:
         200: Configuration publique
     """
-    return jsonify({
-        'debug': current_app.debug,
-        'mayan_url': current_app.config.get('MAYAN_URL', 'not configured'),
-        'ollama_url': current_app.config.get('OLLAMA_URL', 'not configured'),
-        'ollama_model': current_app.config.get('OLLAMA_MODEL', 'not configured'),
-        'cors_origins': current_app.config.get('CORS_ORIGINS', [])
-    }), 200
-
+    # La configuration ne change pas après le démarrage : corps construit
+    # au premier appel puis conservé dans l'application
+    body = current_app.extensions.get('config_info')
+    if body is None:
+        body = orjson.dumps({
+            'debug': current_app.debug,
+            'mayan_url': current_app.config.get('MAYAN_URL', 'not configured'),
+            'ollama_url': current_app.config.get('OLLAMA_URL', 'not configured'),
+            'ollama_model': current_app.config.get('OLLAMA_MODEL', 'not configured'),
+            'cors_origins': current_app.config.get('CORS_ORIGINS', [])
+        })
+        current_app.extensions['config_info'] = body
+    return _json_response(body)
@@ -5,8 +5,11 @@ Réservées aux administrateurs
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import Schema, fields, validate, ValidationError
+from sqlalchemy.exc import IntegrityError
 from models import db
-from models.user import User
+from models.user import User, CONFLICT_MESSAGES
+from utils.roles import current_user_is_admin, forget_user_status
+from utils.pagination import page_args
 from functools import wraps
 import logging
 
@@ -22,10 +25,8 @@ def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user or not user.is_admin():
+        # Claim du token ; base de données seulement pour les anciens tokens
+        if not current_user_is_admin():
             return jsonify({'error': 'Accès refusé. Droits administrateur requis.'}), 403
         
         return fn(*args, **kwargs)
@@ -53,6 +54,11 @@ class CreateUserSchema(Schema):
     role = fields.String(validate=validate.OneOf(['user', 'admin']), load_default='user')
 
 
+# Instances partagées (les schémas marshmallow sont sans état)
+update_user_schema = UpdateUserSchema()
+create_user_schema = CreateUserSchema()
+
+
 # =========== Routes ===========
 
 @users_bp.route('', methods=['GET'])
@@ -71,8 +77,7 @@ def list_users():
     Returns:
         200: Liste paginée des utilisateurs
     """
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    page, per_page = page_args()
     role = request.args.get('role')
     active = request.args.get('active')
     search = request.args.get('search')
@@ -117,7 +122,7 @@ def get_user(user_id):
         200: Détails de l'utilisateur
         404: Utilisateur non trouvé
     """
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     
     if not user:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
@@ -147,16 +152,14 @@ def create_user():
         409: Username ou email déjà utilisé
     """
     try:
-        data = CreateUserSchema().load(request.json)
+        data = create_user_schema.load(request.json)
     except ValidationError as e:
         return jsonify({'error': 'Données invalides', 'details': e.messages}), 400
     
-    # Vérifier unicité
-    if User.query.filter_by(username=data['username']).first():
-        return jsonify({'error': 'Ce nom d\'utilisateur est déjà utilisé'}), 409
-    
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({'error': 'Cet email est déjà utilisé'}), 409
+    # Vérifier unicité (une seule requête)
+    conflict = User.find_conflict(data['username'], data['email'])
+    if conflict:
+        return jsonify({'error': CONFLICT_MESSAGES[conflict]}), 409
     
     try:
         user = User.create_user(**data)
@@ -166,9 +169,13 @@ def create_user():
             'user': user.to_dict()
         }), 201
         
-    except Exception as e:
+    except IntegrityError:
+        # Création concurrente avec le même username/email
         db.session.rollback()
-        logger.error(f"Erreur création utilisateur: {e}")
+        return jsonify({'error': 'Nom d\'utilisateur ou email déjà utilisé'}), 409
+    except Exception:
+        db.session.rollback()
+        logger.exception("Erreur création utilisateur")
         return jsonify({'error': 'Erreur lors de la création'}), 500
 
 
@@ -190,26 +197,32 @@ def update_user(user_id):
         400: Données invalides
         404: Utilisateur non trouvé
     """
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     
     if not user:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
     
     try:
-        data = UpdateUserSchema().load(request.json)
+        data = update_user_schema.load(request.json)
     except ValidationError as e:
         return jsonify({'error': 'Données invalides', 'details': e.messages}), 400
     
     # Vérifier unicité de l'email si modifié
-    if 'email' in data and data['email'] != user.email:
-        if User.query.filter_by(email=data['email']).first():
-            return jsonify({'error': 'Cet email est déjà utilisé'}), 409
+    if 'email' in data and data['email'].lower() != user.email.lower():
+        if User.email_taken(data['email']):
+            return jsonify({'error': CONFLICT_MESSAGES['email']}), 409
     
     # Mettre à jour les champs
     for key, value in data.items():
         setattr(user, key, value)
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Email pris entre la vérification et l'écriture
+        db.session.rollback()
+        return jsonify({'error': CONFLICT_MESSAGES['email']}), 409
+    forget_user_status(user_id)
     
     return jsonify({
         'message': 'Utilisateur mis à jour',
@@ -234,7 +247,7 @@ def delete_user(user_id):
     if user_id == current_user_id:
         return jsonify({'error': 'Vous ne pouvez pas supprimer votre propre compte'}), 400
     
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     
     if not user:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
@@ -242,6 +255,7 @@ def delete_user(user_id):
     username = user.username
     db.session.delete(user)
     db.session.commit()
+    forget_user_status(user_id)
     
     return jsonify({
         'message': f'Utilisateur {username} supprimé'
@@ -258,17 +272,15 @@ def activate_user(user_id):
         200: Compte activé
         404: Utilisateur non trouvé
     """
-    user = User.query.get(user_id)
+    user = User.set_active(user_id, True)
+    forget_user_status(user_id)
     
-    if not user:
+    if user is None:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
     
-    user.is_active = True
-    db.session.commit()
-    
     return jsonify({
         'message': 'Compte activé',
-        'user': user.to_dict()
+        'user': user
     }), 200
 
 
@@ -288,17 +300,15 @@ def deactivate_user(user_id):
     if user_id == current_user_id:
         return jsonify({'error': 'Vous ne pouvez pas désactiver votre propre compte'}), 400
     
-    user = User.query.get(user_id)
+    user = User.set_active(user_id, False)
+    forget_user_status(user_id)
     
-    if not user:
+    if user is None:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
     
-    user.is_active = False
-    db.session.commit()
-    
     return jsonify({
         'message': 'Compte désactivé',
-        'user': user.to_dict()
+        'user': user
     }), 200
 
 
@@ -316,7 +326,7 @@ def reset_password(user_id):
         400: Données invalides
         404: Utilisateur non trouvé
     """
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     
     if not user:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
@@ -1,8 +1,28 @@
 """
 Services de l'application
 """
+from flask import current_app
+
 from services.mayan_service import MayanService
 from services.ai_service import AIService
 
-__all__ = ['MayanService', 'AIService']
 
+def _shared(name: str, factory):
+    """Instance unique du service par application (créée au premier appel)"""
+    service = current_app.extensions.get(name)
+    if service is None:
+        service = current_app.extensions[name] = factory()
+    return service
+
+
+def shared_mayan_service() -> MayanService:
+    """Service Mayan de l'application (session HTTP keep-alive partagée)"""
+    return _shared('mayan_service', MayanService)
+
+
+def shared_ai_service() -> AIService:
+    """Service IA de l'application (session HTTP keep-alive partagée)"""
+    return _shared('ai_service', AIService)
+
+
+__all__ = ['MayanService', 'AIService', 'shared_mayan_service', 'shared_ai_service']
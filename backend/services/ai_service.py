@@ -1,6 +1,382 @@
+"""
+Service d'intégration avec Ollama (IA locale)
+Génère résumés, mots-clés et réponses aux questions sur les documents
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future
+from itertools import islice
+from typing import Optional, Dict, List, Iterator
+
+import orjson
+import requests
+from flask import current_app
+
+from utils.http import get_http_session
+
+logger = logging.getLogger(__name__)
+
+# Fenêtre de contexte demandée à Ollama (tokens), part réservée aux
+# consignes (système + demande) et longueur maximale de la réponse par
+# tâche (num_predict) ; le reste de la fenêtre revient au document
+NUM_CTX = 2048
+PROMPT_OVERHEAD_TOKENS = 128
+TASK_MAX_TOKENS = {
+    'analysis': 768,
+    'summary': 384,
+    'keywords': 128,
+    'answer': 512,
+}
+# Estimation grossière : ~4 octets UTF-8 par token. Compter en octets plutôt
+# qu'en caractères borne aussi les textes accentués ou non latins, dont
+# chaque caractère coûte davantage de tokens
+BYTES_PER_TOKEN = 4
+
+# Consigne système identique pour toutes les tâches, suivie du document puis
+# de la demande : les appels successifs sur un même document (résumé,
+# mots-clés, questions) partagent le même préfixe de prompt, dont Ollama
+# réutilise le cache KV au lieu de refaire le prefill
+SYSTEM_PROMPT = (
+    "Tu es un assistant d'analyse documentaire. Tu réponds uniquement à partir "
+    "du document fourni, sans inventer d'information."
+)
+
+# Taille des listes demandées par l'analyse complète
+ANALYSIS_KEYWORDS = 10
+ANALYSIS_KEY_POINTS = 5
+
+# Nettoyage du texte OCR (expressions compilées une fois, exécutées en C)
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+_INLINE_SPACES = re.compile(r'[ \t\u00a0]+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+# Bloc porteur d'information : au moins 3 caractères alphanumériques
+# (écarte numéros de page, traits, artefacts d'OCR isolés)
+_INFORMATIVE = re.compile(r'(?:\w\W*){3}')
+# Séparateurs des mots-clés renvoyés par le modèle (virgules, ou à défaut
+# points-virgules / retours à la ligne)
+_KEYWORD_SEPARATORS = re.compile(r'[,;\n]')
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation du nombre de tokens d'un texte"""
+    return len(text.encode()) // BYTES_PER_TOKEN + 1
+
+
+def content_budget(task: str) -> int:
+    """Tokens disponibles pour le document dans le contexte d'une tâche"""
+    return NUM_CTX - PROMPT_OVERHEAD_TOKENS - TASK_MAX_TOKENS[task]
+
+
+def prepare_content(content: str, max_tokens: int) -> str:
+    """
+    Prépare le texte OCR avant envoi au modèle : suppression des caractères
+    de contrôle, des espaces et lignes vides répétés et des blocs sans
+    contenu, puis troncature (en octets UTF-8) au budget de tokens du contexte.
+    Le nettoyage porte sur une fenêtre à peine plus large que le budget :
+    inutile de parcourir un document de plusieurs Mo pour en garder
+    quelques milliers de caractères.
+    """
+    max_bytes = max_tokens * BYTES_PER_TOKEN
+    # Un caractère fait au moins un octet : la fenêtre couvre le budget
+    text = content[:max_bytes * 2]
+    text = _CONTROL_CHARS.sub('', text)
+    text = _INLINE_SPACES.sub(' ', text)
+    text = _BLANK_LINES.sub('\n\n', text)
+    blocks = [b.strip() for b in text.split('\n\n') if _INFORMATIVE.search(b)]
+    text = '\n\n'.join(blocks)
+    encoded = text.encode()
+    if len(encoded) <= max_bytes:
+        return text
+    # Coupe en octets ; un caractère multi-octets tronqué est écarté
+    return encoded[:max_bytes].decode(errors='ignore')
+
+# Résultat du dernier test de connexion, par URL Ollama (cache du processus).
+# Un succès reste valable 1,5 s, un échec 0,3 s pour détecter vite le retour
+_HEALTH: Dict[str, Dict] = {}
+HEALTH_TTL_OK = 1.5
+HEALTH_TTL_KO = 0.3
+
+# Liste des modèles installés, par URL Ollama : change rarement
+_MODELS: Dict[str, Dict] = {}
+MODELS_TTL = 60
+
+# Générations en cours dans le processus, par empreinte de la requête :
+# un appel identique concurrent attend le résultat du premier au lieu
+# d'occuper un second slot Ollama
+_INFLIGHT: Dict[bytes, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+
+def _string_list(value) -> List[str]:
+    """Chaînes non vides d'une liste JSON ; [] si la valeur n'est pas une liste"""
+    if not isinstance(value, list):
+        return []
+    return [item.strip() for item in value if isinstance(item, str) and item.strip()]
+
+
 class AIService:
-    def __init__(self):
-        pass
+    """
+    Service pour interagir avec l'API Ollama.
+    Documentation API Ollama: https://github.com/ollama/ollama/blob/main/docs/api.md
+    """
+
+    def __init__(self, base_url: str = None, model: str = None):
+        """
+        Initialise le service IA.
+
+        Args:
+            base_url: URL de base d'Ollama (ex: http://service_ia_locale:11434)
+            model: Nom du modèle à utiliser (ex: llama3.2:3b-instruct-q4_K_M)
+        """
+        self.base_url = base_url or current_app.config.get('OLLAMA_URL', 'http://service_ia_locale:11434')
+        self.model = model or current_app.config.get('OLLAMA_MODEL', 'llama3.2:3b-instruct-q4_K_M')
+        self.session = get_http_session('ollama')
+
+    def _generate(self, prompt: str, task: str, timeout: int = 300,
+                  json_format: bool = False, **options) -> Optional[str]:
+        """
+        Envoie un prompt au modèle et retourne la réponse complète.
+
+        Args:
+            prompt: Prompt à envoyer
+            task: Tâche (clé de TASK_MAX_TOKENS), borne la longueur de la réponse
+            timeout: Délai maximal en secondes
+            json_format: Contraindre la sortie à du JSON valide (format Ollama)
+            **options: Options de génération supplémentaires (temperature...)
+
+        Returns:
+            Texte généré, ou None en cas d'erreur (ou de réponse JSON coupée
+            par num_predict)
+        """
+        payload = {
+            'model': self.model,
+            'system': SYSTEM_PROMPT,
+            'prompt': prompt,
+            'stream': False,
+            'options': {
+                'num_ctx': NUM_CTX,
+                'num_predict': TASK_MAX_TOKENS[task],
+                **options
+            }
+        }
+        if json_format:
+            payload['format'] = 'json'
+
+        key = hashlib.blake2b(
+            orjson.dumps(payload, option=orjson.OPT_SORT_KEYS), digest_size=16
+        ).digest()
+        with _INFLIGHT_LOCK:
+            pending = _INFLIGHT.get(key)
+            if pending is None:
+                _INFLIGHT[key] = future = Future()
+        if pending is not None:
+            return pending.result()
+
+        result = None
+        try:
+            result = self._post_generate(payload, timeout)
+        finally:
+            with _INFLIGHT_LOCK:
+                del _INFLIGHT[key]
+            future.set_result(result)
+        return result
+
+    def _post_generate(self, payload: Dict, timeout: int) -> Optional[str]:
+        """Appel non-streamé à /api/generate, None en cas d'erreur"""
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json=payload,
+                timeout=timeout
+            )
+            if response.status_code == 200:
+                # Corps décodé une seule fois, par orjson (C)
+                body = orjson.loads(response.content)
+                if body.get('done_reason') == 'length' and payload.get('format') == 'json':
+                    # JSON coupé par num_predict : inexploitable
+                    logger.warning("Réponse Ollama tronquée (num_predict=%s)",
+                                   payload['options']['num_predict'])
+                    return None
+                return body.get('response', '').strip()
+            logger.error(f"Erreur génération Ollama: {response.status_code} - {response.text}")
+            return None
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
+            logger.error(f"Erreur requête Ollama: {e}")
+            return None
+
+    def _generate_stream(self, prompt: str, task: str, timeout: int = 300) -> Iterator[str]:
+        """
+        Envoie un prompt au modèle et renvoie les fragments de texte au fil
+        de la génération (API Ollama en mode stream, une ligne JSON par fragment).
+        Lève requests.RequestException en cas d'erreur.
+        """
+        with self.session.post(
+            f"{self.base_url}/api/generate",
+            json={
+                'model': self.model,
+                'system': SYSTEM_PROMPT,
+                'prompt': prompt,
+                'stream': True,
+                'options': {'num_ctx': NUM_CTX, 'num_predict': TASK_MAX_TOKENS[task]}
+            },
+            timeout=timeout,
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                token = chunk.get('response')
+                if token:
+                    yield token
+                if chunk.get('done'):
+                    break
+
+    # =========== Analyse ===========
+
+    @staticmethod
+    def _document_prompt(content: str, instruction: str, task: str) -> str:
+        """Prompt {document, demande} : le document d'abord (préfixe commun aux tâches)"""
+        return f"Document:\n{prepare_content(content, content_budget(task))}\n\n{instruction}"
+
+    def _summary_prompt(self, content: str, language: str) -> str:
+        return self._document_prompt(
+            content,
+            f"Résume ce document en quelques phrases, en langue '{language}'.",
+            'summary'
+        )
+
+    def generate_summary(self, content: str, language: str = 'fr') -> Optional[str]:
+        """Génère un résumé du document"""
+        return self._generate(self._summary_prompt(content, language), 'summary')
+
+    def stream_summary(self, content: str, language: str = 'fr') -> Iterator[str]:
+        """Génère un résumé du document, fragment par fragment"""
+        return self._generate_stream(self._summary_prompt(content, language), 'summary')
+
+    def extract_keywords(self, content: str, count: int = 10,
+                         language: str = 'fr') -> List[str]:
+        """Extrait les mots-clés du document"""
+        prompt = self._document_prompt(
+            content,
+            f"Extrais les {count} mots-clés les plus importants de ce document, "
+            f"en langue '{language}'. Réponds uniquement par une liste séparée par des virgules.",
+            'keywords'
+        )
+        result = self._generate(prompt, 'keywords')
+        if not result:
+            return []
+        # Sans les lignes d'introduction ("Voici les mots-clés :")
+        result = '\n'.join(
+            line for line in result.splitlines() if not line.rstrip().endswith(':')
+        )
+        # Une passe : découpe, nettoyage, filtrage des vides, arrêt à `count`
+        keywords = (k.strip() for k in _KEYWORD_SEPARATORS.split(result))
+        return list(islice(filter(None, keywords), count))
+
+    def _question_prompt(self, content: str, question: str, language: str) -> str:
+        return self._document_prompt(
+            content,
+            f"En te basant uniquement sur ce document, réponds à la question "
+            f"en langue '{language}'.\n\nQuestion: {question}",
+            'answer'
+        )
+
+    def ask_question(self, content: str, question: str,
+                     language: str = 'fr') -> Optional[str]:
+        """Répond à une question à partir du contenu du document"""
+        return self._generate(self._question_prompt(content, question, language), 'answer')
+
+    def stream_answer(self, content: str, question: str,
+                      language: str = 'fr') -> Iterator[str]:
+        """Répond à une question, fragment par fragment"""
+        return self._generate_stream(self._question_prompt(content, question, language), 'answer')
+
+    def analyze_document(self, content: str, language: str = 'fr') -> Optional[Dict]:
+        """
+        Analyse complète : résumé, mots-clés et points clés.
+
+        Returns:
+            Dict {summary, keywords, key_points} ou None en cas d'erreur
+        """
+        # Les trois tâches en un seul appel : un seul prefill du document
+        prompt = self._document_prompt(
+            content,
+            f"Analyse ce document en langue '{language}'. Réponds uniquement en JSON "
+            f"strict avec les clés \"summary\" (texte), \"keywords\" (liste de "
+            f"{ANALYSIS_KEYWORDS} chaînes) et \"key_points\" (liste de {ANALYSIS_KEY_POINTS} "
+            f"chaînes).",
+            'analysis'
+        )
+        result = None
+        # Sortie JSON contrainte ; en cas de réponse invalide, une seconde
+        # tentative à température nulle
+        for options in ({}, {'temperature': 0}):
+            result = self._generate(prompt, 'analysis', json_format=True, **options)
+            if not result:
+                return None
+            try:
+                data = orjson.loads(result)
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                summary = data.get('summary')
+                return {
+                    'summary': summary.strip() if isinstance(summary, str) else
+                               ('' if summary is None else str(summary)),
+                    'keywords': _string_list(data.get('keywords'))[:ANALYSIS_KEYWORDS],
+                    'key_points': _string_list(data.get('key_points'))[:ANALYSIS_KEY_POINTS]
+                }
+
+        # Réponse non structurée : on la garde comme résumé
+        return {'summary': result, 'keywords': [], 'key_points': []}
+
+    # =========== Utilitaires ===========
+
+    def check_connection(self, force: bool = False) -> bool:
+        """
+        Vérifie la connexion à Ollama (résultat mis en cache brièvement).
+        force=True ignore le résultat en cache.
+        """
+        now = time.monotonic()
+        health = _HEALTH.get(self.base_url)
+        if health and not force and now < health['until']:
+            return health['ok']
+
+        try:
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+
+        _HEALTH[self.base_url] = {
+            'ok': ok,
+            'until': time.monotonic() + (HEALTH_TTL_OK if ok else HEALTH_TTL_KO)
+        }
+        return ok
+
+    def list_models(self, force: bool = False) -> List[str]:
+        """
+        Liste les modèles disponibles sur Ollama (mise en cache MODELS_TTL
+        secondes ; seules les réponses valides sont conservées).
+        force=True ignore la liste en cache.
+        """
+        cached = _MODELS.get(self.base_url)
+        if cached and not force and time.monotonic() < cached['until']:
+            return cached['models']
+
+        try:
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=10)
+            if response.status_code != 200:
+                return []
+            models = [m.get('name') for m in orjson.loads(response.content).get('models', [])]
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
+            logger.error(f"Erreur liste modèles Ollama: {e}")
+            return []
 
-    def generate_response(self, prompt):
-        return "AI Service is not yet implemented."
+        _MODELS[self.base_url] = {'models': models, 'until': time.monotonic() + MODELS_TTL}
+        return models
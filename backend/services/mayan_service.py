@@ -4,12 +4,94 @@ Gère toutes les communications avec l'API Mayan
 """
 import requests
 from flask import current_app
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Callable, Iterable, Iterator, BinaryIO
 import base64
+import hashlib
 import logging
+import orjson
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial, wraps
+from itertools import islice
+from requests_toolbelt import MultipartEncoder
+from werkzeug.http import parse_options_header
+from utils.http import get_http_session
+from utils.cache import cache_get, cache_set, cache_delete, cache_delete_pattern
 
 logger = logging.getLogger(__name__)
 
+# Taille de page maximale transmise à Mayan (listes et recherche), même
+# pour les appels hors routes HTTP (tâches, scripts)
+MAX_PAGE_SIZE = 100
+
+# Taille des blocs relayés lors d'un téléchargement de fichier (octets)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Récupération parallèle du texte OCR des pages (une requête Mayan par page),
+# partagée par le processus. Au plus OCR_FETCH_WORKERS requêtes en vol, et
+# autant de pages d'avance par document : avec les threads gunicorn, le
+# total reste sous HTTP_POOL_SIZE
+OCR_FETCH_WORKERS = 8
+_ocr_pool = ThreadPoolExecutor(max_workers=OCR_FETCH_WORKERS, thread_name_prefix='mayan-ocr')
+
+# État de la connexion à Mayan, par URL (cache du processus). Un succès
+# reste valable HEALTH_TTL_OK secondes, un échec isolé HEALTH_TTL_KO ;
+# après HEALTH_BREAKER_FAILS échecs consécutifs, Mayan est tenu pour
+# indisponible HEALTH_BREAKER_RESET secondes sans nouvelle sonde
+_HEALTH: Dict[str, Dict] = {}
+HEALTH_TTL_OK = 5
+HEALTH_TTL_KO = 1
+HEALTH_BREAKER_FAILS = 5
+HEALTH_BREAKER_RESET = 30
+
+
+def _ocr_map(fn: Callable[[Any], Any], items: Iterable) -> Iterator:
+    """
+    Comme _ocr_pool.map, dans l'ordre, mais sans soumettre plus de
+    OCR_FETCH_WORKERS appels d'avance : un long document n'occupe pas
+    toute la file du pool
+    """
+    items = iter(items)
+    window = deque(_ocr_pool.submit(fn, item) for item in islice(items, OCR_FETCH_WORKERS))
+    while window:
+        result = window.popleft().result()
+        for item in islice(items, 1):
+            window.append(_ocr_pool.submit(fn, item))
+        yield result
+
+
+def _empty_page() -> Dict:
+    """Liste paginée vide, renvoyée quand Mayan est injoignable"""
+    return {'count': 0, 'results': []}
+
+
+def mayan_safe(message: str, default: Callable[[], Any] = lambda: None):
+    """
+    Décorateur des appels à Mayan : une erreur réseau (RequestException)
+    est journalisée sous `message` et la méthode renvoie default()
+    (une valeur neuve à chaque appel, la liste vide peut être modifiée)
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            except requests.RequestException as e:
+                logger.error(f"{message}: {e}")
+                return default()
+        return wrapper
+    return decorator
+
+
+@lru_cache(maxsize=256)
+def _token_headers(token: str) -> Dict[str, str]:
+    """Headers d'un token utilisateur, construits une fois par token"""
+    return {
+        'Authorization': f'Token {token}',
+        'Content-Type': 'application/json'
+    }
+
 
 class MayanService:
     """
@@ -29,28 +111,84 @@ class MayanService:
         self.base_url = base_url or current_app.config.get('MAYAN_URL', 'http://mayan:8000')
         self.username = username or current_app.config.get('MAYAN_ADMIN_USER', 'admin')
         self.password = password or current_app.config.get('MAYAN_ADMIN_PASSWORD', 'admin')
+        self.content_cache_ttl = current_app.config.get('MAYAN_CONTENT_CACHE_TTL', 3600)
+        self.document_cache_ttl = current_app.config.get('MAYAN_DOCUMENT_CACHE_TTL', 30)
+        self.types_cache_ttl = current_app.config.get('MAYAN_TYPES_CACHE_TTL', 300)
+        self.etag_cache_ttl = current_app.config.get('MAYAN_ETAG_CACHE_TTL', 3600)
+        self.list_cache_ttl = current_app.config.get('MAYAN_LIST_CACHE_TTL', 15)
+        self.upload_pending_ttl = current_app.config.get('MAYAN_UPLOAD_PENDING_TTL', 30)
         self._token = None
+        self._auth_headers = None
+        # POST /documents/upload/ disponible ? (None = pas encore essayé)
+        self._combined_upload = None
         self.api_url = f"{self.base_url}/api/v4"
+        self.session = get_http_session('mayan')
+
+    def bound(self, token: Optional[str]) -> 'BoundMayanService':
+        """Vue du service dont les méthodes reçoivent déjà `token`"""
+        return BoundMayanService(self, token)
+
+    @staticmethod
+    def _token_scope(token: Optional[str]) -> str:
+        """
+        Portée d'une entrée de cache : les réponses Mayan dépendent des
+        permissions du token (empreinte, le token n'apparaît pas en clair)
+        """
+        if not token:
+            return 'admin'
+        return hashlib.blake2b(token.encode(), digest_size=8).hexdigest()
+
+    @staticmethod
+    def _cached_json(key: str, ttl: int, fetch):
+        """Lit `key` dans le cache Redis, sinon appelle fetch() et mémorise un résultat non vide"""
+        cached = cache_get(key)
+        if cached is not None:
+            return orjson.loads(cached)
+        value = fetch()
+        if value:
+            cache_set(key, orjson.dumps(value), ttl)
+        return value
+
+    @staticmethod
+    def _json(response: requests.Response) -> Any:
+        """
+        Décode le corps JSON d'une réponse Mayan avec orjson, directement
+        depuis les octets. Un corps invalide lève une RequestException,
+        comme response.json().
+        """
+        try:
+            return orjson.loads(response.content)
+        except orjson.JSONDecodeError as e:
+            raise requests.exceptions.InvalidJSONError(
+                f"Réponse Mayan non JSON: {e}", response=response
+            ) from e
 
     def _get_auth_headers(self) -> Dict[str, str]:
-        """Retourne les headers d'authentification Basic"""
-        credentials = base64.b64encode(
-            f"{self.username}:{self.password}".encode()
-        ).decode()
-        return {
-            'Authorization': f'Basic {credentials}',
-            'Content-Type': 'application/json'
-        }
+        """
+        Retourne les headers d'authentification Basic.
+        Calculés une seule fois par instance : le dict est partagé et ne
+        doit pas être modifié par l'appelant.
+        """
+        if self._auth_headers is None:
+            credentials = base64.b64encode(
+                f"{self.username}:{self.password}".encode()
+            ).decode()
+            self._auth_headers = {
+                'Authorization': f'Basic {credentials}',
+                'Content-Type': 'application/json'
+            }
+        return self._auth_headers
 
     def _get_token_headers(self, token: str) -> Dict[str, str]:
-        """Retourne les headers avec un token utilisateur"""
-        return {
-            'Authorization': f'Token {token}',
-            'Content-Type': 'application/json'
-        }
+        """
+        Retourne les headers avec un token utilisateur (dict partagé, comme
+        pour _get_auth_headers : ne pas le modifier)
+        """
+        return _token_headers(token)
 
     def _request(self, method: str, endpoint: str,
-                 token: str = None, **kwargs) -> requests.Response:
+                 token: str = None, headers: Dict[str, str] = None,
+                 **kwargs) -> requests.Response:
         """
         Effectue une requête vers l'API Mayan.
 
@@ -58,16 +196,18 @@ class MayanService:
             method: Méthode HTTP (GET, POST, PUT, DELETE)
             endpoint: Endpoint de l'API (ex: /documents/)
             token: Token utilisateur (optionnel, utilise auth admin sinon)
+            headers: Headers ajoutés à ceux d'authentification
             **kwargs: Arguments supplémentaires pour requests
 
         Returns:
             Response object
         """
         url = f"{self.api_url}{endpoint}"
-        headers = self._get_token_headers(token) if token else self._get_auth_headers()
+        auth_headers = self._get_token_headers(token) if token else self._get_auth_headers()
+        headers = {**auth_headers, **headers} if headers else auth_headers
 
         try:
-            response = requests.request(
+            response = self.session.request(
                 method=method,
                 url=url,
                 headers=headers,
@@ -79,8 +219,43 @@ class MayanService:
             logger.error(f"Erreur requête Mayan: {e}")
             raise
 
+    def _get_revalidated(self, endpoint: str, token: str = None) -> Optional[Any]:
+        """
+        GET conditionnel : si Mayan a fourni un ETag pour cet endpoint (et
+        ce token), il est renvoyé en If-None-Match et un 304 réutilise le
+        corps mémorisé dans Redis (MAYAN_ETAG_CACHE_TTL secondes).
+
+        Returns:
+            Corps JSON décodé, ou None si Mayan ne répond ni 200 ni 304
+        """
+        key = f"mayan:etag:{self._token_scope(token)}:{endpoint}"
+        cached = cache_get(key)
+        etag, _, body = cached.partition(b'\n') if cached else (None, None, None)
+
+        response = self._request(
+            'GET', endpoint, token=token,
+            headers={'If-None-Match': etag.decode()} if etag else None
+        )
+        if response.status_code == 304 and body:
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                # Corps mémorisé illisible : oublié, puis relu en entier
+                cache_delete(key)
+                response = self._request('GET', endpoint, token=token)
+        if response.status_code != 200:
+            return None
+
+        # Décodé avant la mise en cache : un corps invalide n'est pas mémorisé
+        data = self._json(response)
+        new_etag = response.headers.get('ETag')
+        if new_etag and '\n' not in new_etag:
+            cache_set(key, new_etag.encode() + b'\n' + response.content, self.etag_cache_ttl)
+        return data
+
     # =========== Authentification ===========
 
+    @mayan_safe("Erreur authentification Mayan")
     def authenticate_user(self, username: str, password: str) -> Optional[str]:
         """
         Authentifie un utilisateur et retourne son token Mayan.
@@ -92,19 +267,16 @@ class MayanService:
         Returns:
             Token d'authentification ou None si échec
         """
-        try:
-            response = requests.post(
-                f"{self.api_url}/auth/token/obtain/",
-                json={'username': username, 'password': password},
-                timeout=30
-            )
-            if response.status_code == 200:
-                return response.json().get('token')
-            return None
-        except requests.RequestException as e:
-            logger.error(f"Erreur authentification Mayan: {e}")
-            return None
-
+        response = self.session.post(
+            f"{self.api_url}/auth/token/obtain/",
+            json={'username': username, 'password': password},
+            timeout=30
+        )
+        if response.status_code == 200:
+            return self._json(response).get('token')
+        return None
+
+    @mayan_safe("Erreur création utilisateur Mayan")
     def create_mayan_user(self, username: str, email: str,
                           password: str, first_name: str = '',
                           last_name: str = '') -> Optional[Dict]:
@@ -121,42 +293,50 @@ class MayanService:
         Returns:
             Données de l'utilisateur créé ou None
         """
-        try:
-            response = self._request(
-                'POST',
-                '/users/',
-                json={
-                    'username': username,
-                    'email': email,
-                    'password': password,
-                    'first_name': first_name,
-                    'last_name': last_name
-                }
-            )
-            if response.status_code == 201:
-                return response.json()
-            logger.warning(f"Échec création utilisateur Mayan: {response.text}")
-            return None
-        except requests.RequestException as e:
-            logger.error(f"Erreur création utilisateur Mayan: {e}")
-            return None
-
+        response = self._request(
+            'POST',
+            '/users/',
+            json={
+                'username': username,
+                'email': email,
+                'password': password,
+                'first_name': first_name,
+                'last_name': last_name
+            }
+        )
+        if response.status_code == 201:
+            return self._json(response)
+        logger.warning(f"Échec création utilisateur Mayan: {response.text}")
+        return None
+
+    @mayan_safe("Erreur récupération utilisateur Mayan")
     def get_user_by_username(self, username: str) -> Optional[Dict]:
         """Récupère un utilisateur Mayan par son username"""
-        try:
-            response = self._request('GET', f'/users/?username={username}')
-            if response.status_code == 200:
-                results = response.json().get('results', [])
-                return results[0] if results else None
-            return None
-        except requests.RequestException as e:
-            logger.error(f"Erreur récupération utilisateur Mayan: {e}")
-            return None
+        response = self._request('GET', '/users/', params={'username': username})
+        if response.status_code == 200:
+            results = self._json(response).get('results', [])
+            return results[0] if results else None
+        return None
 
     # =========== Documents ===========
 
+    @staticmethod
+    def _list_params(page: int, page_size: int,
+                     id_in: Optional[Iterable[int]], **extra) -> Dict[str, Any]:
+        """
+        Paramètres de requête d'une liste paginée, encodés par requests.
+        page et page_size sont bornés (page >= 1, 1 <= page_size <= MAX_PAGE_SIZE).
+        id_in restreint la liste à certains IDs (None = aucun filtre).
+        """
+        params = dict(extra, page=max(page, 1),
+                      page_size=min(max(page_size, 1), MAX_PAGE_SIZE))
+        if id_in is not None:
+            params['id__in'] = ','.join(str(i) for i in sorted(id_in))
+        return params
+
     def get_documents(self, token: str = None, page: int = 1,
-                      page_size: int = 20) -> Dict:
+                      page_size: int = 20,
+                      id_in: Optional[Iterable[int]] = None) -> Dict:
         """
         Liste tous les documents.
 
@@ -164,22 +344,37 @@ class MayanService:
             token: Token utilisateur
             page: Numéro de page
             page_size: Taille de page
+            id_in: IDs autorisés (None = tous les documents)
 
         Returns:
-            Liste paginée des documents
+            Liste paginée des documents (mise en cache MAYAN_LIST_CACHE_TTL
+            secondes, par token et filtre ; lue directement tant qu'un
+            upload différé est en cours)
         """
-        try:
-            response = self._request(
-                'GET',
-                f'/documents/?page={page}&page_size={page_size}',
-                token=token
-            )
-            if response.status_code == 200:
-                return response.json()
-            return {'count': 0, 'results': []}
-        except requests.RequestException as e:
-            logger.error(f"Erreur liste documents: {e}")
+        if id_in is not None and not id_in:
             return {'count': 0, 'results': []}
+        params = self._list_params(page, page_size, id_in)
+
+        @mayan_safe("Erreur liste documents")
+        def fetch():
+            response = self._request('GET', '/documents/', token=token, params=params)
+            if response.status_code == 200:
+                return self._json(response)
+            return None
+
+        scope = self._token_scope(token)
+        if cache_get(f"mayan:docs-pending:{scope}") is not None:
+            # Upload accepté mais pas encore traité : ne pas figer une
+            # liste où le document manque encore
+            return fetch() or {'count': 0, 'results': []}
+
+        digest = hashlib.blake2b(
+            orjson.dumps(params, option=orjson.OPT_SORT_KEYS), digest_size=8
+        ).hexdigest()
+        return self._cached_json(
+            f"mayan:docs:{scope}:{digest}",
+            self.list_cache_ttl, fetch
+        ) or {'count': 0, 'results': []}
 
     def get_document(self, document_id: int, token: str = None) -> Optional[Dict]:
         """
@@ -190,16 +385,17 @@ class MayanService:
             token: Token utilisateur
 
         Returns:
-            Détails du document ou None
+            Détails du document ou None (mis en cache MAYAN_DOCUMENT_CACHE_TTL
+            secondes, par token)
         """
-        try:
-            response = self._request('GET', f'/documents/{document_id}/', token=token)
-            if response.status_code == 200:
-                return response.json()
-            return None
-        except requests.RequestException as e:
-            logger.error(f"Erreur récupération document: {e}")
-            return None
+        @mayan_safe("Erreur récupération document")
+        def fetch():
+            return self._get_revalidated(f'/documents/{document_id}/', token=token)
+
+        return self._cached_json(
+            f"mayan:doc:{document_id}:{self._token_scope(token)}",
+            self.document_cache_ttl, fetch
+        )
 
     def get_document_content(self, document_id: int, token: str = None) -> Optional[str]:
         """
@@ -212,6 +408,26 @@ class MayanService:
         Returns:
             Contenu texte du document
         """
+        chunks = self.iter_document_content(document_id, token=token)
+        return None if chunks is None else ''.join(chunks)
+
+    def iter_document_content(self, document_id: int,
+                              token: str = None) -> Optional[Iterator[str]]:
+        """
+        Contenu texte (OCR) d'un document, page par page.
+        Les pages sont demandées en parallèle et restituées dans l'ordre ;
+        la méthode attend seulement la première page non vide avant de
+        rendre la main, pour savoir si du texte existe. Le texte complet
+        est mis en cache à la fin de l'itération (itérer dans un contexte
+        d'application).
+
+        Args:
+            document_id: ID du document
+            token: Token utilisateur
+
+        Returns:
+            Itérateur des morceaux de texte, ou None si aucun contenu
+        """
         try:
             # Récupérer la dernière version du document
             response = self._request(
@@ -222,13 +438,20 @@ class MayanService:
             if response.status_code != 200:
                 return None
 
-            versions = response.json().get('results', [])
+            versions = self._json(response).get('results', [])
             if not versions:
                 return None
 
             latest_version = versions[0]
             version_id = latest_version.get('id')
 
+            # Texte OCR déjà récupéré pour cette version : une nouvelle
+            # version (ré-OCR, nouveau fichier) change la clé
+            cache_key = f"mayan:content:{document_id}:{version_id}"
+            cached = cache_get(cache_key)
+            if cached is not None:
+                return iter((cached.decode(),))
+
             # Récupérer les pages de la version
             response = self._request(
                 'GET',
@@ -238,31 +461,64 @@ class MayanService:
             if response.status_code != 200:
                 return None
 
-            pages = response.json().get('results', [])
-            content_parts = []
-
-            # Récupérer le contenu OCR de chaque page
-            for page in pages:
-                page_id = page.get('id')
-                ocr_response = self._request(
-                    'GET',
-                    f'/documents/{document_id}/versions/{version_id}/pages/{page_id}/ocr/',
-                    token=token
-                )
-                if ocr_response.status_code == 200:
-                    ocr_data = ocr_response.json()
-                    content = ocr_data.get('content', '')
-                    if content:
-                        content_parts.append(content)
-
-            return '\n\n'.join(content_parts) if content_parts else None
+            pages = self._json(response).get('results', [])
 
         except requests.RequestException as e:
             logger.error(f"Erreur récupération contenu document: {e}")
             return None
 
+        # Contenu OCR des pages, récupéré en parallèle et restitué dans
+        # l'ordre des pages
+        texts = _ocr_map(
+            lambda page: self._page_ocr(document_id, version_id, page.get('id'), token),
+            pages
+        )
+
+        complete = True
+        first = None
+        for text in texts:
+            if text:
+                first = text
+                break
+            complete = False
+        if first is None:
+            return None
+
+        def generate():
+            content_parts = [first]
+            all_pages = complete
+            yield first
+            for text in texts:
+                if text:
+                    content_parts.append(text)
+                    yield '\n\n' + text
+                else:
+                    all_pages = False
+            # Pas de mise en cache d'un OCR partiel (pages encore en traitement)
+            if all_pages:
+                cache_set(cache_key, '\n\n'.join(content_parts), self.content_cache_ttl)
+
+        return generate()
+
+    def _page_ocr(self, document_id: int, version_id: int, page_id: int,
+                  token: str = None) -> str:
+        """Texte OCR d'une page ('' si indisponible)"""
+        try:
+            ocr_response = self._request(
+                'GET',
+                f'/documents/{document_id}/versions/{version_id}/pages/{page_id}/ocr/',
+                token=token
+            )
+            if ocr_response.status_code == 200:
+                return self._json(ocr_response).get('content', '') or ''
+        except requests.RequestException as e:
+            logger.error(f"Erreur récupération OCR page {page_id}: {e}")
+        return ''
+
+    @mayan_safe("Erreur recherche documents", default=_empty_page)
     def search_documents(self, query: str, token: str = None,
-                         page: int = 1, page_size: int = 20) -> Dict:
+                         page: int = 1, page_size: int = 20,
+                         id_in: Optional[Iterable[int]] = None) -> Dict:
         """
         Recherche dans les documents (OCR full-text).
 
@@ -271,90 +527,161 @@ class MayanService:
             token: Token utilisateur
             page: Numéro de page
             page_size: Taille de page
+            id_in: IDs autorisés (None = tous les documents)
 
         Returns:
             Résultats de recherche paginés
         """
-        try:
-            response = self._request(
-                'GET',
-                f'/search/documents/?q={query}&page={page}&page_size={page_size}',
-                token=token
-            )
-            if response.status_code == 200:
-                return response.json()
-            return {'count': 0, 'results': []}
-        except requests.RequestException as e:
-            logger.error(f"Erreur recherche documents: {e}")
+        if id_in is not None and not id_in:
             return {'count': 0, 'results': []}
+        response = self._request(
+            'GET',
+            '/search/documents/',
+            token=token,
+            params=self._list_params(page, page_size, id_in, q=query)
+        )
+        if response.status_code == 200:
+            return self._json(response)
+        return {'count': 0, 'results': []}
 
 
 
-    def upload_document(self, file_data: bytes, filename: str,
-                        document_type_id: int = 1, token: str = None) -> Optional[Dict]:
+    def upload_document(self, file_stream: BinaryIO, filename: str,
+                        document_type_id: int = 1, token: str = None,
+                        content_type: str = None) -> Optional[Dict]:
         """
         Upload un nouveau document dans Mayan.
+        Le fichier est transmis par morceaux depuis le flux, sans être
+        chargé en mémoire. Un seul appel (POST /documents/upload/) si Mayan
+        le propose, sinon création du document puis ajout du fichier.
 
         Args:
-            file_data: Données binaires du fichier
+            file_stream: Flux binaire du fichier (ex: FileStorage.stream)
             filename: Nom du fichier
             document_type_id: ID du type de document
             token: Token utilisateur (optionnel)
+            content_type: Type MIME du fichier
 
         Returns:
-            Détails du fichier attaché ou None en cas d'erreur
+            Détails du document créé, ou None en cas d'erreur. Si Mayan
+            accepte l'upload en différé (202 sans corps), le document n'existe
+            pas encore : {"label": filename, "pending": True}, sans "id".
         """
         try:
             # Utiliser le token utilisateur si disponible, sinon utiliser les identifiants admin
             headers = self._get_token_headers(token) if token else self._get_auth_headers()
-
-            # Créer le document
-            doc_resp = requests.post(
-                f"{self.api_url}/documents/",
-                headers={**headers, "Content-Type": "application/json"},
-                json={
-                    "label": filename,
-                    "description": filename or "",
-                    "document_type_id": document_type_id
-                },
-                timeout=30
-            )
-            logger.debug(f"Response création document: {doc_resp.status_code} - {doc_resp.text}")
-            
-            if doc_resp.status_code not in (200, 201):
-                logger.error(f"Erreur création document: {doc_resp.status_code} - {doc_resp.text}")
-                return None
-
-            document_data = doc_resp.json()
-            document_id = document_data.get("id")
-            
-            if not document_id:
-                logger.error(f"Document ID manquant dans la réponse: {doc_resp.text}")
-                return None
-
-            # Préparer les headers pour l'upload de fichier (sans Content-Type pour multipart)
             upload_headers = {k: v for k, v in headers.items() if k.lower() != 'content-type'}
+            file_field = (filename, file_stream, content_type or "application/octet-stream")
+
+            document = None
+            if self._combined_upload is not False:
+                document = self._upload_combined(upload_headers, file_field, document_type_id)
+            if document is None and self._combined_upload is False:
+                # Endpoint absent (Mayan plus ancien) : repartir du début du flux
+                file_stream.seek(0)
+                document = self._upload_two_step(headers, upload_headers, file_field, document_type_id)
+
+            if document is not None:
+                # Le nouveau document doit apparaître dans les listes de l'auteur
+                scope = self._token_scope(token)
+                if document.get("pending"):
+                    # Créé plus tard par Mayan : listes lues sans cache d'ici là
+                    cache_set(f"mayan:docs-pending:{scope}", b"1", self.upload_pending_ttl)
+                cache_delete_pattern(f"mayan:docs:{scope}:*")
+            return document
 
-            # Uploader le fichier
-            file_resp = requests.post(
-                f"{self.api_url}/documents/{document_id}/files/",
-                headers=upload_headers,
-                files={"file_new": (filename, file_data)},
-                data={"action": 1},  # 1=Replace, 2=Append, 3=Keep
-                timeout=60
-            )
-            logger.debug(f"Response upload fichier: {file_resp.status_code} - {file_resp.text}")
-            
-            if file_resp.status_code in (200, 201, 202):
-                return document_data
+        except Exception as e:
+            logger.exception(f"Erreur upload: {e}")
+            return None
+
+    def _upload_combined(self, upload_headers: Dict[str, str], file_field: tuple,
+                         document_type_id: int) -> Optional[Dict]:
+        """
+        Création du document et envoi du fichier en une requête multipart.
+        Marque l'endpoint comme indisponible (404/405) ou disponible (2xx)
+        pour cette instance ; une autre erreur ne tranche pas.
+        """
+        filename = file_field[0]
+        encoder = MultipartEncoder(fields={
+            "document_type_id": str(document_type_id),
+            "label": filename,
+            "description": filename or "",
+            "file": file_field
+        })
+        response = self.session.post(
+            f"{self.api_url}/documents/upload/",
+            headers={**upload_headers, "Content-Type": encoder.content_type},
+            data=encoder,
+            timeout=60
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response upload document: %s - %s", response.status_code, response.text)
+
+        if response.status_code in (404, 405):
+            self._combined_upload = False
+            return None
 
-            logger.error(f"Erreur upload fichier: {file_resp.status_code} - {file_resp.text}")
+        if response.status_code in (200, 201, 202):
+            self._combined_upload = True
+            if response.content:
+                return self._json(response)
+            # Upload mis en file par Mayan : pas encore d'ID de document
+            return {"label": filename, "pending": True}
+
+        logger.error(f"Erreur upload document: {response.status_code} - {response.text}")
+        return None
+
+    def _upload_two_step(self, headers: Dict[str, str], upload_headers: Dict[str, str],
+                         file_field: tuple, document_type_id: int) -> Optional[Dict]:
+        """Création du document (JSON) puis ajout de son fichier (multipart)"""
+        filename = file_field[0]
+        doc_resp = self.session.post(
+            f"{self.api_url}/documents/",
+            headers={**headers, "Content-Type": "application/json"},
+            json={
+                "label": filename,
+                "description": filename or "",
+                "document_type_id": document_type_id
+            },
+            timeout=30
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response création document: %s - %s", doc_resp.status_code, doc_resp.text)
+
+        if doc_resp.status_code not in (200, 201):
+            logger.error(f"Erreur création document: {doc_resp.status_code} - {doc_resp.text}")
             return None
 
-        except Exception as e:
-            logger.exception(f"Erreur upload: {e}")
+        document_data = self._json(doc_resp)
+        document_id = document_data.get("id")
+
+        if not document_id:
+            logger.error(f"Document ID manquant dans la réponse: {doc_resp.text}")
             return None
 
+        # Corps multipart lu à la demande depuis le flux
+        encoder = MultipartEncoder(fields={
+            "action": "1",  # 1=Replace, 2=Append, 3=Keep
+            "file_new": file_field
+        })
+
+        # Uploader le fichier
+        file_resp = self.session.post(
+            f"{self.api_url}/documents/{document_id}/files/",
+            headers={**upload_headers, "Content-Type": encoder.content_type},
+            data=encoder,
+            timeout=60
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response upload fichier: %s - %s", file_resp.status_code, file_resp.text)
+
+        if file_resp.status_code in (200, 201, 202):
+            return document_data
+
+        logger.error(f"Erreur upload fichier: {file_resp.status_code} - {file_resp.text}")
+        return None
+
+    @mayan_safe("Erreur téléchargement document")
     def download_document(self, document_id: int, token: str = None) -> Optional[tuple]:
         """
         Télécharge le fichier d'un document.
@@ -364,150 +691,175 @@ class MayanService:
             token: Token utilisateur
         
         Returns:
-            Tuple (file_data, filename, content_type) ou None
+            Tuple (chunks, filename, content_type, content_length) ou None.
+            `chunks` itère sur le fichier par blocs de DOWNLOAD_CHUNK_SIZE
+            octets, lus depuis Mayan au fil de l'envoi au client ;
+            content_length vaut None si Mayan ne l'indique pas.
         """
-        try:
-            # Récupérer les informations du document pour le nom
-            doc_response = self._request('GET', f'/documents/{document_id}/', token=token)
-            if doc_response.status_code != 200:
-                logger.error(f"Document {document_id} non trouvé")
-                return None
-            
-            document = doc_response.json()
-            label = document.get('label', f'document_{document_id}')
-            
-            # Récupérer la dernière version du document
-            response = self._request(
-                'GET',
-                f'/documents/{document_id}/versions/',
-                token=token
-            )
-            print(response)
-            if response.status_code != 200:
-                logger.error(f"Impossible de récupérer les versions du document {document_id}")
-                return None
-            
-            versions = response.json().get('results', [])
-            if not versions:
-                logger.error(f"Aucune version trouvée pour le document {document_id}")
-                return None
-            
-            latest_version = versions[0]
-            version_id = latest_version.get('id')
-            
-            # Récupérer le fichier de la version
-            headers = self._get_token_headers(token) if token else self._get_auth_headers()
-            # Supprimer Content-Type pour le téléchargement binaire
-            headers.pop('Content-Type', None)
-            
-            download_url = f"{self.api_url}/documents/{document_id}/versions/{version_id}/download/"
-            
-            file_response = requests.get(
-                download_url,
-                headers=headers,
-                timeout=60,
-                stream=True
-            )
-            print(file_response)
-            if file_response.status_code == 200:
-                content_type = file_response.headers.get('Content-Type', 'application/octet-stream')
-                # Essayer d'obtenir le nom de fichier depuis Content-Disposition
-                content_disposition = file_response.headers.get('Content-Disposition', '')
-                filename = label
-                if 'filename=' in content_disposition:
-                    import re
-                    match = re.search(r'filename="?([^";\n]+)"?', content_disposition)
-                    if match:
-                        filename = match.group(1)
-                
-                return (file_response.content, filename, content_type)
-            
-            logger.error(f"Erreur téléchargement: {file_response.status_code}")
+        # Récupérer les informations du document pour le nom
+        doc_response = self._request('GET', f'/documents/{document_id}/', token=token)
+        if doc_response.status_code != 200:
+            logger.error(f"Document {document_id} non trouvé")
             return None
-            
-        except requests.RequestException as e:
-            logger.error(f"Erreur téléchargement document: {e}")
+        
+        document = self._json(doc_response)
+        label = document.get('label', f'document_{document_id}')
+        
+        # Récupérer la dernière version du document
+        response = self._request(
+            'GET',
+            f'/documents/{document_id}/versions/',
+            token=token
+        )
+        if response.status_code != 200:
+            logger.error(f"Impossible de récupérer les versions du document {document_id}")
             return None
+        
+        versions = self._json(response).get('results', [])
+        if not versions:
+            logger.error(f"Aucune version trouvée pour le document {document_id}")
+            return None
+        
+        latest_version = versions[0]
+        version_id = latest_version.get('id')
+        
+        # Récupérer le fichier de la version
+        headers = self._get_token_headers(token) if token else self._get_auth_headers()
+        # Sans Content-Type pour le téléchargement binaire (copie : les
+        # headers admin sont partagés)
+        headers = {k: v for k, v in headers.items() if k.lower() != 'content-type'}
+        
+        download_url = f"{self.api_url}/documents/{document_id}/versions/{version_id}/download/"
+        
+        file_response = self.session.get(
+            download_url,
+            headers=headers,
+            timeout=60,
+            stream=True
+        )
+        if file_response.status_code == 200:
+            content_type = file_response.headers.get('Content-Type', 'application/octet-stream')
+            # Essayer d'obtenir le nom de fichier depuis Content-Disposition
+            content_disposition = file_response.headers.get('Content-Disposition', '')
+            # (filename* RFC 5987 décodé par werkzeug)
+            _, params = parse_options_header(content_disposition)
+            filename = params.get('filename') or label
+            
+            def chunks():
+                try:
+                    yield from file_response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+                finally:
+                    file_response.close()
+
+            return (chunks(), filename, content_type,
+                    file_response.headers.get('Content-Length'))
+        
+        file_response.close()
+        logger.error(f"Erreur téléchargement: {file_response.status_code}")
+        return None
 
     # =========== Cabinets ===========
 
+    @mayan_safe("Erreur liste cabinets", default=list)
     def get_cabinets(self, token: str = None) -> List[Dict]:
         """Liste tous les cabinets/dossiers"""
-        try:
-            response = self._request('GET', '/cabinets/', token=token)
-            if response.status_code == 200:
-                return response.json().get('results', [])
-            return []
-        except requests.RequestException as e:
-            logger.error(f"Erreur liste cabinets: {e}")
-            return []
+        data = self._get_revalidated('/cabinets/', token=token)
+        return data.get('results', []) if data else []
 
+    @mayan_safe("Erreur liste documents cabinet", default=list)
     def get_cabinet_documents(self, cabinet_id: int, token: str = None) -> List[Dict]:
         """Liste les documents d'un cabinet"""
-        try:
-            response = self._request(
-                'GET',
-                f'/cabinets/{cabinet_id}/documents/',
-                token=token
-            )
-            if response.status_code == 200:
-                return response.json().get('results', [])
-            return []
-        except requests.RequestException as e:
-            logger.error(f"Erreur liste documents cabinet: {e}")
-            return []
+        response = self._request(
+            'GET',
+            f'/cabinets/{cabinet_id}/documents/',
+            token=token
+        )
+        if response.status_code == 200:
+            return self._json(response).get('results', [])
+        return []
 
     # =========== Types de documents ===========
 
     def get_document_types(self, token: str = None) -> List[Dict]:
-        """Liste tous les types de documents"""
-        try:
-            response = self._request('GET', '/document_types/', token=token)
-            if response.status_code == 200:
-                return response.json().get('results', [])
-            return []
-        except requests.RequestException as e:
-            logger.error(f"Erreur liste types documents: {e}")
-            return []
+        """Liste tous les types de documents (mis en cache MAYAN_TYPES_CACHE_TTL secondes, par token)"""
+        @mayan_safe("Erreur liste types documents", default=list)
+        def fetch():
+            data = self._get_revalidated('/document_types/', token=token)
+            return data.get('results', []) if data else []
+
+        return self._cached_json(
+            f"mayan:doctypes:{self._token_scope(token)}",
+            self.types_cache_ttl, fetch
+        )
 
     # =========== Tags ===========
 
+    @mayan_safe("Erreur récupération tags", default=list)
     def get_document_tags(self, document_id: int, token: str = None) -> List[Dict]:
         """Récupère les tags d'un document"""
-        try:
-            response = self._request(
-                'GET',
-                f'/documents/{document_id}/tags/',
-                token=token
-            )
-            if response.status_code == 200:
-                return response.json().get('results', [])
-            return []
-        except requests.RequestException as e:
-            logger.error(f"Erreur récupération tags: {e}")
-            return []
+        data = self._get_revalidated(f'/documents/{document_id}/tags/', token=token)
+        return data.get('results', []) if data else []
 
     # =========== Utilitaires ===========
 
-    def check_connection(self) -> bool:
-        """Vérifie la connexion à Mayan"""
+    def check_connection(self, force: bool = False) -> bool:
+        """
+        Vérifie la connexion à Mayan (résultat mis en cache, coupe-circuit
+        après des échecs répétés). force=True ignore le résultat en cache.
+        """
+        now = time.monotonic()
+        health = _HEALTH.get(self.base_url)
+        if health and not force and now < health['until']:
+            return health['ok']
+
         try:
-            response = requests.get(
+            # HEAD : statut seul, sans transférer la racine de l'API
+            response = self.session.head(
                 f"{self.base_url}/api/v4/",
                 timeout=10
             )
-            return response.status_code in [200, 401]
+            ok = response.status_code in (200, 401)
         except requests.RequestException:
-            return False
+            ok = False
+
+        failures = 0 if ok else (health['failures'] if health else 0) + 1
+        if ok:
+            ttl = HEALTH_TTL_OK
+        elif failures >= HEALTH_BREAKER_FAILS:
+            ttl = HEALTH_BREAKER_RESET
+        else:
+            ttl = HEALTH_TTL_KO
+        _HEALTH[self.base_url] = {
+            'ok': ok,
+            'failures': failures,
+            'until': time.monotonic() + ttl
+        }
+        return ok
 
+    @mayan_safe("Erreur info API")
     def get_api_info(self) -> Optional[Dict]:
         """Récupère les informations de l'API Mayan"""
-        try:
-            response = self._request('GET', '/')
-            if response.status_code == 200:
-                return response.json()
-            return None
-        except requests.RequestException as e:
-            logger.error(f"Erreur info API: {e}")
-            return None
+        response = self._request('GET', '/')
+        if response.status_code == 200:
+            return self._json(response)
+        return None
+
+
+class BoundMayanService:
+    """
+    Service Mayan lié au token d'un utilisateur, pour les méthodes qui
+    acceptent `token` : mayan.get_document(42) équivaut à
+    service.get_document(42, token=token).
+    """
+
+    __slots__ = ('_service', '_token')
+
+    def __init__(self, service: MayanService, token: Optional[str]):
+        self._service = service
+        self._token = token
 
+    def __getattr__(self, name: str):
+        attr = getattr(self._service, name)
+        if callable(attr):
+            return partial(attr, token=self._token)
+        return attr
@@ -0,0 +1,24 @@
+"""
+Tâches asynchrones (Celery)
+Les traitements longs (analyse IA) sont exécutés par un worker séparé :
+la requête HTTP rend la main immédiatement, sans garder de connexion
+PostgreSQL ni de thread gunicorn pendant l'inférence.
+"""
+from celery import Celery, Task
+
+
+def celery_init_app(app) -> Celery:
+    """
+    Crée l'application Celery liée à l'application Flask.
+    Chaque tâche s'exécute dans un app_context (accès à db, config...).
+    """
+    class FlaskTask(Task):
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+
+    celery_app = Celery(app.name, task_cls=FlaskTask)
+    celery_app.config_from_object(app.config['CELERY'])
+    celery_app.set_default()
+    app.extensions['celery'] = celery_app
+    return celery_app
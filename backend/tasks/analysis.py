@@ -0,0 +1,55 @@
+"""
+Tâche d'analyse IA d'un document
+"""
+import logging
+import time
+
+from celery import shared_task
+
+from models import db
+from models.user import User
+from models.document_analysis import DocumentAnalysis
+from services import shared_mayan_service, shared_ai_service
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def run_analysis(analysis_id: int) -> None:
+    """
+    Récupère le contenu OCR du document, l'analyse avec Ollama puis
+    enregistre le résultat (completed) ou l'erreur (failed).
+    """
+    analysis = db.session.get(DocumentAnalysis, analysis_id)
+    if analysis is None:
+        logger.warning(f"Analyse {analysis_id} introuvable")
+        return
+
+    try:
+        user = db.session.get(User, analysis.user_id)
+        content = shared_mayan_service().get_document_content(
+            analysis.document_id, token=user.mayan_token if user else None
+        )
+        # Libérer la connexion PostgreSQL pendant les appels externes
+        db.session.commit()
+
+        if not content:
+            analysis.mark_failed('Contenu non disponible (OCR peut-être en cours)')
+            return
+
+        started = time.monotonic()
+        result = shared_ai_service().analyze_document(content, language=analysis.language)
+        if not result:
+            analysis.mark_failed('Service IA indisponible ou réponse incomplète')
+            return
+
+        analysis.mark_completed(
+            summary=result['summary'],
+            keywords=result['keywords'],
+            key_points=result['key_points'],
+            processing_time=time.monotonic() - started
+        )
+    except Exception as e:
+        logger.error(f"Erreur analyse IA {analysis_id}: {e}")
+        db.session.rollback()
+        analysis.mark_failed(str(e))
@@ -0,0 +1,108 @@
+"""
+Synchronisation des comptes avec Mayan EDMS (SSO)
+Exécutée hors requête : l'inscription et la connexion rendent les
+tokens JWT sans attendre les appels à Mayan.
+"""
+import logging
+
+from celery import shared_task
+
+from models import db
+from models.user import User
+from models.temporary_access import TemporaryAccess
+from services import shared_mayan_service
+
+logger = logging.getLogger(__name__)
+
+# Représentation des arguments dans les logs et événements Celery : le mot
+# de passe transmis au worker n'y apparaît jamais
+HIDDEN_ARGS = '(<masqué>)'
+
+
+def enqueue(task, *args) -> bool:
+    """
+    Planifie une tâche de synchronisation sans faire échouer la requête :
+    broker indisponible = erreur journalisée, l'appelant poursuit (la
+    synchronisation se refera à la prochaine connexion).
+    """
+    try:
+        task.apply_async(args=args, argsrepr=HIDDEN_ARGS, kwargsrepr='{}')
+        return True
+    except Exception:
+        logger.exception(f"Impossible de planifier {task.name}")
+        return False
+
+
+@shared_task(ignore_result=True)
+def sync_mayan_user(user_id: int, username: str, email: str, password: str,
+                    first_name: str = '', last_name: str = '') -> None:
+    """
+    Crée le compte Mayan de l'utilisateur (ou retrouve un compte déjà créé),
+    enregistre son ID Mayan puis obtient son token
+    """
+    mayan = shared_mayan_service()
+    try:
+        mayan_user = mayan.create_mayan_user(
+            username=username,
+            email=email,
+            password=password,
+            first_name=first_name,
+            last_name=last_name
+        ) or mayan.get_user_by_username(username)
+    except Exception as e:
+        logger.warning(f"Impossible de créer l'utilisateur Mayan: {e}")
+        return
+
+    if not mayan_user:
+        return
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        user.mayan_user_id = mayan_user.get('id')
+        db.session.commit()
+        logger.info(f"Utilisateur Mayan créé: {mayan_user.get('id')}")
+        fetch_mayan_token(user_id, username, password)
+
+
+@shared_task(ignore_result=True)
+def fetch_mayan_token(user_id: int, username: str, password: str) -> None:
+    """Obtient un token Mayan pour l'utilisateur et l'enregistre"""
+    try:
+        mayan_token = shared_mayan_service().authenticate_user(username, password)
+    except Exception as e:
+        logger.warning(f"Impossible d'obtenir le token Mayan: {e}")
+        return
+
+    if not mayan_token:
+        return
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        user.mayan_token = mayan_token
+        db.session.commit()
+        prefetch_documents(user)
+
+
+# Taille de la première page demandée par le client (page_args)
+PREFETCH_PAGE_SIZE = 20
+
+
+def prefetch_documents(user: User) -> None:
+    """
+    Charge la première page de la liste des documents dans le cache
+    (MAYAN_LIST_CACHE_TTL), avec le même filtre que GET /api/documents :
+    le premier écran après la connexion est servi sans attendre Mayan.
+    """
+    token = user.mayan_token
+    id_in = TemporaryAccess.allowed_document_ids(user)
+    if id_in is not None and not id_in:
+        return
+    # Libérer la connexion PostgreSQL pendant l'appel à Mayan
+    db.session.commit()
+
+    try:
+        shared_mayan_service().get_documents(
+            token=token, page=1, page_size=PREFETCH_PAGE_SIZE, id_in=id_in
+        )
+    except Exception as e:
+        logger.debug(f"Préchargement des documents impossible: {e}")
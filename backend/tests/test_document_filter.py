@@ -0,0 +1,39 @@
+"""
+Filtre des listes de documents : aucun document interdit ne sort, même
+si Mayan ignore le paramètre id__in
+"""
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_jwt_extended')
+pytest.importorskip('sqlalchemy')
+
+from routes.documents import restrict_to_allowed  # noqa: E402
+
+
+def mayan_page(*ids):
+    """Page Mayan qui ignore id__in : elle renvoie tous les documents"""
+    return {'count': 50, 'results': [{'id': i, 'label': f'doc {i}'} for i in ids]}
+
+
+def test_filter_ignored_by_mayan_returns_only_allowed():
+    results, total = restrict_to_allowed(mayan_page(1, 2, 3, 4), frozenset({2, 4}))
+
+    assert [doc['id'] for doc in results] == [2, 4]
+    assert total == 2
+
+
+def test_filter_applied_by_mayan_is_kept():
+    results, total = restrict_to_allowed(
+        {'count': 2, 'results': [{'id': 2}, {'id': 4}]}, frozenset({2, 4})
+    )
+
+    assert [doc['id'] for doc in results] == [2, 4]
+    assert total == 2
+
+
+def test_no_restriction_for_full_access():
+    results, total = restrict_to_allowed(mayan_page(1, 2, 3), None)
+
+    assert [doc['id'] for doc in results] == [1, 2, 3]
+    assert total == 50
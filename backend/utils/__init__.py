@@ -2,6 +2,9 @@
 Utility modules
 """
 from utils.roles import Role, role_required, admin_required, authenticated_user, get_current_user
+from utils.cache import init_cache, get_redis
+from utils.http import init_http_sessions, get_http_session
 
-__all__ = ['Role', 'role_required', 'admin_required', 'authenticated_user', 'get_current_user']
+__all__ = ['Role', 'role_required', 'admin_required', 'authenticated_user', 'get_current_user',
+           'init_cache', 'get_redis', 'init_http_sessions', 'get_http_session']
 
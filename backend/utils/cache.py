@@ -0,0 +1,168 @@
+"""
+Cache Redis partagé
+Client unique par application, avec repli silencieux si Redis est indisponible
+"""
+import logging
+import time
+from functools import wraps
+from typing import Optional
+
+import redis
+from flask import current_app, request, make_response
+
+# Politiques de cache des endpoints : (durée de fraîcheur, rétention de la
+# copie périmée servie si l'amont échoue), en secondes
+CACHE_POLICIES = {
+    'short': (5, 300),
+    'normal': (30, 3600),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def init_cache(app) -> None:
+    """
+    Crée le client Redis de l'application à partir de RATELIMIT_STORAGE_URL.
+    Aucun client n'est créé si l'URL n'est pas une URL Redis (ex: memory://).
+    """
+    url = app.config.get('RATELIMIT_STORAGE_URL', '')
+    client = None
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        client = redis.Redis.from_url(
+            url,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5
+        )
+    app.extensions['redis'] = client
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """Retourne le client Redis de l'application courante (ou None)"""
+    return current_app.extensions.get('redis')
+
+
+def cache_get(key: str) -> Optional[bytes]:
+    """Lit une clé du cache, None si absente ou si Redis est indisponible"""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        return client.get(key)
+    except redis.RedisError as e:
+        logger.debug(f"Cache indisponible (get {key}): {e}")
+        return None
+
+
+def cache_set(key: str, value, ttl: int) -> None:
+    """Écrit une clé avec une durée de vie en secondes"""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.setex(key, ttl, value)
+    except redis.RedisError as e:
+        logger.debug(f"Cache indisponible (set {key}): {e}")
+
+
+def cache_add(key: str, value, ttl: int) -> bool:
+    """
+    Écrit la clé seulement si elle n'existe pas encore (SET NX).
+    Retourne False si la clé existait déjà ; True si elle a été écrite ou
+    si Redis est indisponible (aucune coordination possible, l'appelant
+    poursuit seul).
+    """
+    client = get_redis()
+    if client is None:
+        return True
+    try:
+        return bool(client.set(key, value, ex=ttl, nx=True))
+    except redis.RedisError as e:
+        logger.debug(f"Cache indisponible (add {key}): {e}")
+        return True
+
+
+def cache_delete(*keys: str) -> None:
+    """Supprime une ou plusieurs clés"""
+    client = get_redis()
+    if client is None or not keys:
+        return
+    try:
+        client.delete(*keys)
+    except redis.RedisError as e:
+        logger.debug(f"Cache indisponible (delete): {e}")
+
+
+def cache_delete_pattern(pattern: str) -> None:
+    """Supprime toutes les clés correspondant au motif (SCAN, non bloquant)"""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        keys = list(client.scan_iter(match=pattern, count=500))
+        if keys:
+            client.delete(*keys)
+    except redis.RedisError as e:
+        logger.debug(f"Cache indisponible (delete {pattern}): {e}")
+
+
+def _cached_response(entry: dict, state: str):
+    """Reconstruit une réponse Flask à partir d'une entrée du cache"""
+    response = make_response(entry[b'body'], int(entry[b'status']))
+    response.headers['Content-Type'] = entry[b'content_type'].decode()
+    response.headers['X-Cache'] = state
+    return response
+
+
+def cache_endpoint(policy: str):
+    """
+    Met en cache Redis la réponse d'un endpoint dont le contenu ne dépend pas
+    de l'utilisateur (clé: chemin de la requête).
+    Entrée stockée dans un hash {generated_at, stale_at, status, content_type, body}.
+    Si l'amont échoue (5xx) après péremption, la dernière copie est servie
+    avec l'en-tête X-Cache: STALE. `?force=1` ignore la copie en cache et
+    la régénère.
+    """
+    fresh_ttl, stale_ttl = CACHE_POLICIES[policy]
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            client = get_redis()
+            if client is None:
+                return fn(*args, **kwargs)
+
+            key = f"http:{request.path}"
+            try:
+                entry = client.hgetall(key)
+            except redis.RedisError as e:
+                logger.debug(f"Cache indisponible (hgetall {key}): {e}")
+                entry = {}
+
+            now = time.time()
+            force = request.args.get('force', '').lower() in ('1', 'true')
+            if entry and not force and float(entry[b'stale_at']) > now:
+                return _cached_response(entry, 'HIT')
+
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code >= 500 and entry:
+                return _cached_response(entry, 'STALE')
+
+            if response.status_code == 200:
+                try:
+                    pipe = client.pipeline()
+                    pipe.hset(key, mapping={
+                        'generated_at': now,
+                        'stale_at': now + fresh_ttl,
+                        'status': response.status_code,
+                        'content_type': response.content_type,
+                        'body': response.get_data()
+                    })
+                    pipe.expire(key, stale_ttl)
+                    pipe.execute()
+                except redis.RedisError as e:
+                    logger.debug(f"Cache indisponible (hset {key}): {e}")
+
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
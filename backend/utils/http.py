@@ -0,0 +1,55 @@
+"""
+Sessions HTTP partagées (Mayan EDMS, Ollama)
+Une session requests par service et par processus : les connexions TCP
+restent ouvertes (keep-alive) et sont réutilisées d'un appel à l'autre
+"""
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def _build_session(pool_size: int, retry: Retry) -> requests.Session:
+    """Crée une session avec un pool de connexions et la politique de retries donnée"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def init_http_sessions(app) -> None:
+    """Enregistre les sessions Mayan et Ollama dans app.extensions"""
+    pool_size = app.config.get('HTTP_POOL_SIZE', 20)
+    # Mayan : méthodes idempotentes rejouées sur erreur réseau ou 502/503/504
+    app.extensions['mayan_session'] = _build_session(pool_size, Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504]
+    ))
+    # Ollama : une génération (POST) n'est rejouée que si elle n'a pas pu
+    # commencer — échec de connexion, ou 502/503 (serveur indisponible ou
+    # file pleine). Jamais après un timeout de lecture : l'inférence peut
+    # être en cours et un rejeu occuperait le GPU plusieurs fois
+    app.extensions['ollama_session'] = _build_session(pool_size, Retry(
+        total=3,
+        connect=3,
+        read=0,
+        other=0,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503],
+        allowed_methods=None
+    ))
+
+
+def get_http_session(name: str) -> requests.Session:
+    """
+    Retourne la session partagée du service ('mayan' ou 'ollama').
+    Hors application initialisée, retombe sur une session jetable.
+    """
+    session = current_app.extensions.get(f'{name}_session')
+    return session if session is not None else requests.Session()
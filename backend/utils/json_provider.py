@@ -0,0 +1,28 @@
+"""
+Fournisseur JSON Flask basé sur orjson
+Remplace le module json de la bibliothèque standard pour jsonify()
+"""
+import orjson
+from flask.json.provider import JSONProvider
+
+_ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+class OrjsonProvider(JSONProvider):
+    """Sérialisation orjson (C, UTF-8 natif) pour toutes les réponses JSON"""
+    
+    mimetype = 'application/json'
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        """Construit la réponse directement à partir des bytes orjson"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS),
+            mimetype=self.mimetype
+        )
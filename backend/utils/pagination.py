@@ -0,0 +1,97 @@
+"""
+Pagination des listes
+Pagination par curseur (keyset) sur (created_at, id), avec repli sur la
+pagination classique par numéro de page
+"""
+import base64
+import math
+from datetime import datetime
+from typing import Optional, Tuple
+
+import orjson
+from flask import request
+from sqlalchemy import func, tuple_
+
+
+def page_args(default_per_page: int = 20, max_per_page: int = 100) -> Tuple[int, int]:
+    """
+    Lit page et per_page dans la query string, bornés : page >= 1 et
+    1 <= per_page <= max_per_page (un OFFSET négatif ou une page géante
+    ne parviennent jamais à la base).
+    """
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', default_per_page, type=int)
+    return page, min(max(per_page, 1), max_per_page)
+
+
+def encode_cursor(item) -> str:
+    """Curseur opaque désignant la position de `item` dans la liste"""
+    raw = orjson.dumps([item.created_at.isoformat(), item.id])
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Décode un curseur ; lève ValueError s'il est invalide"""
+    try:
+        created_at, item_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (TypeError, ValueError, orjson.JSONDecodeError) as e:
+        raise ValueError(f"Curseur invalide: {cursor}") from e
+
+
+def paginate(query, model, page: int, per_page: int,
+             cursor: Optional[str] = None, exact_total: bool = True) -> Tuple[list, dict]:
+    """
+    Pagine une requête triée du plus récent au plus ancien.
+
+    Avec un curseur, la page suivante est lue par recherche d'index
+    ((created_at, id) < curseur, LIMIT) : coût constant quelle que soit la
+    profondeur, contrairement à OFFSET. Sans curseur, pagination classique
+    par numéro de page (total et nombre de pages inclus) ; le total est lu
+    dans la même requête (COUNT(*) OVER ()), sans SELECT COUNT séparé.
+
+    Avec exact_total=False, le SELECT COUNT(*) est supprimé : on lit
+    per_page + 1 lignes et has_next indique s'il reste une page.
+
+    Returns:
+        (éléments, métadonnées de pagination incluant next_cursor)
+    Raises:
+        ValueError: curseur invalide
+    """
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+
+    if cursor or not exact_total:
+        if cursor:
+            created_at, item_id = decode_cursor(cursor)
+            query = query.filter(tuple_(model.created_at, model.id) < (created_at, item_id))
+        else:
+            query = query.offset((page - 1) * per_page)
+        rows = query.limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_next = len(rows) > per_page
+        meta = {
+            'per_page': per_page,
+            'has_next': has_next,
+            'next_cursor': encode_cursor(items[-1]) if has_next else None
+        }
+        if not cursor:
+            meta['page'] = page
+        return items, meta
+
+    rows = query.add_columns(func.count().over().label('total')) \
+        .offset((page - 1) * per_page).limit(per_page).all()
+    items = [row[0] for row in rows]
+    if rows:
+        total = rows[0].total
+    else:
+        # Page au-delà de la fin : le total n'est pas porté par les lignes
+        total = query.order_by(None).count() if page > 1 else 0
+    has_next = page * per_page < total
+    return items, {
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': math.ceil(total / per_page) if per_page else 0,
+        'has_next': has_next,
+        'next_cursor': encode_cursor(items[-1]) if has_next and items else None
+    }
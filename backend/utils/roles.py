@@ -1,10 +1,15 @@
 """
 Role-Based Access Control (RBAC) utilities
 """
+import time
 from enum import Enum
 from functools import wraps
-from flask import jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import jsonify, g
+from typing import Dict, Optional, Tuple
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+from models import db
 from models.user import User
 
 
@@ -14,14 +19,94 @@ class Role(str, Enum):
     USER = 'user'
 
     @classmethod
-    def values(cls):
-        return [role.value for role in cls]
+    def values(cls) -> frozenset:
+        """Role string values, built once (constant-time membership checks)"""
+        return _ROLE_VALUES
+
+
+_ROLE_VALUES = frozenset(role.value for role in Role)
+
+
+# (is_active, role) snapshots per user id, for role checks without a DB
+# round trip. Per process: other workers may keep a revoked snapshot for
+# up to USER_STATUS_TTL seconds.
+_USER_STATUS: Dict[int, Tuple[float, bool, str]] = {}
+USER_STATUS_TTL = 10
+USER_STATUS_MAX = 10000
+
+
+def get_user_status(user_id) -> Optional[Tuple[bool, str]]:
+    """(is_active, role) of a user, cached USER_STATUS_TTL seconds; None if unknown"""
+    now = time.monotonic()
+    cached = _USER_STATUS.get(user_id)
+    if cached and now < cached[0]:
+        return cached[1], cached[2]
+
+    row = db.session.execute(
+        select(User.is_active, User.role).where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+    if len(_USER_STATUS) >= USER_STATUS_MAX:
+        _USER_STATUS.clear()
+    _USER_STATUS[user_id] = (now + USER_STATUS_TTL, row.is_active, row.role)
+    return row.is_active, row.role
+
+
+def forget_user_status(user_id) -> None:
+    """Drop the cached snapshot after a role/status change or deletion"""
+    _USER_STATUS.pop(user_id, None)
 
 
 def get_current_user():
-    """Get the current authenticated user"""
+    """
+    Get the current authenticated user.
+    Memoized on flask.g so decorators and route bodies share a single
+    SELECT per request.
+    """
+    user_id = get_jwt_identity()
+    cached = g.get('current_user')
+    if cached is None or cached[0] != user_id:
+        g.current_user = (user_id, db.session.get(User, user_id))
+    return g.current_user[1]
+
+
+def get_current_user_lite():
+    """
+    Current user with only the columns needed for access checks and Mayan
+    calls (id, role, is_active, mayan_token). Shares the flask.g slot with
+    get_current_user(): a fully loaded user is reused as is, and any other
+    attribute is lazy-loaded on first access.
+    """
     user_id = get_jwt_identity()
-    return User.query.get(user_id)
+    cached = g.get('current_user')
+    if cached is None or cached[0] != user_id:
+        user = db.session.get(User, user_id, options=[load_only(
+            User.id, User.role, User.is_active, User.mayan_token
+        )])
+        g.current_user = (user_id, user)
+    return g.current_user[1]
+
+
+def token_is_admin() -> Optional[bool]:
+    """
+    Admin flag read from the access token claims (no DB query).
+    Returns None for tokens issued before the claim existed.
+    """
+    return get_jwt().get('is_admin')
+
+
+def current_user_is_admin() -> bool:
+    """
+    Admin check. A token without the admin claim is refused with no DB
+    query; an admin (or pre-claim) token is confirmed against the cached
+    (is_active, role) snapshot, so a deleted, deactivated or demoted admin
+    loses access within USER_STATUS_TTL seconds instead of at token expiry.
+    """
+    if token_is_admin() is False:
+        return False
+    status = get_user_status(get_jwt_identity())
+    return status is not None and status[0] and status[1] == Role.ADMIN.value
 
 
 def role_required(*roles: Role):
@@ -37,25 +122,28 @@ def role_required(*roles: Role):
         def multi_role_route():
             ...
     """
+    # Role string values and error message, computed once at decoration time
+    role_values = [r.value if isinstance(r, Role) else r for r in roles]
+    allowed_roles = frozenset(role_values)
+    denied_message = f'Rôle requis: {", ".join(role_values)}'
+
     def decorator(fn):
         @wraps(fn)
         @jwt_required()
         def wrapper(*args, **kwargs):
-            user = get_current_user()
+            status = get_user_status(get_jwt_identity())
 
-            if not user:
+            if status is None:
                 return jsonify({'error': 'Utilisateur non trouvé'}), 404
 
-            if not user.is_active:
+            is_active, role = status
+            if not is_active:
                 return jsonify({'error': 'Compte désactivé'}), 403
 
-            # Convert roles to their string values for comparison
-            allowed_roles = [r.value if isinstance(r, Role) else r for r in roles]
-
-            if user.role not in allowed_roles:
+            if role not in allowed_roles:
                 return jsonify({
                     'error': 'Accès refusé',
-                    'message': f'Rôle requis: {", ".join(allowed_roles)}'
+                    'message': denied_message
                 }), 403
 
             return fn(*args, **kwargs)
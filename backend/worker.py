@@ -0,0 +1,12 @@
+"""
+Point d'entrée du worker Celery
+Lancement: celery -A worker worker -Q analysis,celery --loglevel=info
+"""
+from app import create_app
+
+flask_app = create_app(load_blueprints=False)
+celery = flask_app.extensions['celery']
+
+# Enregistrer les tâches
+import tasks.analysis  # noqa: E402,F401
+import tasks.mayan_sync  # noqa: E402,F401
@@ -80,7 +80,8 @@ interface LoginResponse {
   user: User;
   access_token: string;
   refresh_token: string;
-  mayan_token?: string;
+  mayan_token?: string | null;
+  mayan_token_pending?: boolean;
 }
 
 interface RegisterResponse {
@@ -193,6 +194,10 @@ class ApiService {
     });
   }
 
+  async getMayanToken(): Promise<ApiResponse<{ mayan_token: string; mayan_user_id: number | null }>> {
+    return this.request<{ mayan_token: string; mayan_user_id: number | null }>('/api/auth/mayan-token');
+  }
+
   async getMe(): Promise<ApiResponse<{ user: User }>> {
     return this.request<{ user: User }>('/api/auth/me');
   }
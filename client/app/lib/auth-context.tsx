@@ -4,6 +4,21 @@ import { createContext, useContext, useState, useEffect, useCallback, ReactNode
 import { api, User } from './api';
 import { useRouter } from 'next/navigation';
 
+// Tentatives de récupération du token Mayan après la connexion
+const MAYAN_TOKEN_ATTEMPTS = 10;
+const MAYAN_TOKEN_DELAY_MS = 1000;
+
+async function pollMayanToken() {
+  for (let attempt = 0; attempt < MAYAN_TOKEN_ATTEMPTS; attempt++) {
+    await new Promise((resolve) => setTimeout(resolve, MAYAN_TOKEN_DELAY_MS));
+    const response = await api.getMayanToken();
+    if (response.data?.mayan_token) {
+      localStorage.setItem('mayan_token', response.data.mayan_token);
+      return;
+    }
+  }
+}
+
 interface AuthContextType {
   user: User | null;
   isLoading: boolean;
@@ -58,6 +73,9 @@ export function AuthProvider({ children }: { children: ReactNode }) {
       localStorage.setItem('refresh_token', response.data.refresh_token);
       if (response.data.mayan_token) {
         localStorage.setItem('mayan_token', response.data.mayan_token);
+      } else if (response.data.mayan_token_pending) {
+        // Token Mayan obtenu en arrière-plan par le backend
+        void pollMayanToken();
       }
       setUser(response.data.user);
       return { success: true };
@@ -4,7 +4,8 @@
 # Pas besoin d'attendre ici car l'entrypoint s'en charge
 
 # Nom du modèle à vérifier et à télécharger
-MODEL_NAME="llama3.2"
+# (même variable que le backend ; tag quantifié Q4_K_M par défaut)
+MODEL_NAME="${OLLAMA_MODEL:-llama3.2:3b-instruct-q4_K_M}"
 
 # Vérifie si le modèle est déjà présent
 # La vérification est plus robuste en cherchant le nom du modèle exact
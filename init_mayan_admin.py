@@ -7,20 +7,29 @@ import os
 import sys
 import time
 
-# Attendre que Django soit prêt
-time.sleep(10)
-
 # Configuration Django pour Mayan
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mayan.settings.production')
 
-try:
-    import django
-    django.setup()
-except Exception as e:
-    print(f"Erreur lors de l'initialisation Django: {e}")
+# Attendre que Django et sa base soient prêts : nouvelle tentative avec
+# attente croissante (0.5 s, 1 s, 2 s... plafonnée à 5 s), ~2 min au total
+READY_ATTEMPTS = 30
+
+for attempt in range(READY_ATTEMPTS):
+    try:
+        import django
+        django.setup()
+        from django.db import connection
+        connection.ensure_connection()
+        break
+    except Exception as e:
+        last_error = e
+        time.sleep(min(0.5 * 2 ** attempt, 5))
+else:
+    print(f"Erreur lors de l'initialisation Django: {last_error}")
     sys.exit(1)
 
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 
 User = get_user_model()
 
@@ -29,25 +38,22 @@ password = 'admin'
 email = 'admin@example.com'
 
 try:
-    admin = User.objects.filter(username=username).first()
-    
-    if admin:
-        # L'utilisateur existe, réinitialiser le mot de passe
-        admin.set_password(password)
-        admin.is_superuser = True
-        admin.is_staff = True
-        admin.is_active = True
-        admin.email = email
-        admin.save()
-        print(f"✅ Utilisateur '{username}' mis à jour")
-    else:
-        # Créer un nouvel utilisateur admin
-        admin = User.objects.create_superuser(
-            username=username,
-            email=email,
-            password=password
-        )
+    # Créer l'admin ou réinitialiser ses droits et son mot de passe
+    # (mot de passe haché d'avance : une seule écriture)
+    admin, created = User.objects.update_or_create(
+        username=username,
+        defaults={
+            'email': email,
+            'password': make_password(password),
+            'is_superuser': True,
+            'is_staff': True,
+            'is_active': True
+        }
+    )
+    if created:
         print(f"✅ Utilisateur admin '{username}' créé")
+    else:
+        print(f"✅ Utilisateur '{username}' mis à jour")
     
     # Vérifier que le mot de passe fonctionne
     test_user = User.objects.get(username=username)